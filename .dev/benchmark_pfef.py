@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# Throughput benchmark for naft.modules.pfef.ExtractIPPackets
+# usage: python .dev/benchmark_pfef.py [size in MB] [-p]
+
+import os
+import sys
+import time
+import random
+import struct
+import tempfile
+import naft.modules.pfef as pfef
+
+
+def ReferenceExtractIPPackets(oFrames, baseAddress, data, options, duplicates, filename=""):
+    # the one data.find loop per byte with a byte-by-byte checksum that FindIPHeaders replaced
+    for headerStart in range(0x45, 0x50 if options else 0x46):
+        index = data.find(headerStart)
+        while index != -1:
+            try:
+                potentialIPHeader = data[index : index + 4 * (data[index] - 0x40)]
+                if pfef.CalculateIPChecksum(potentialIPHeader) == 0:
+                    pfef.AddIPHeader(oFrames, baseAddress, data, index, duplicates, filename)
+            except:
+                pass
+            index = data.find(headerStart, index + 1)
+
+
+def IPPacket(source, destination, payload):
+    header = struct.pack(">BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), 0, 0, 64, 17, 0, source, destination)
+    checksum = pfef.CalculateIPChecksum(header)
+    return header[0:10] + struct.pack("<H", checksum) + header[12:] + payload
+
+
+def SyntheticData(size):
+    oRandom = random.Random(0)
+    data = bytearray(oRandom.randbytes(size))
+    for index in range(1000, size - 1000, 100000):
+        packet = b"\x00\x11\x22\x33\x44\x55\x00\x66\x77\x88\x99\xaa\x08\x00" + IPPacket(
+            oRandom.randbytes(4), oRandom.randbytes(4), oRandom.randbytes(32)
+        )
+        data[index : index + len(packet)] = packet
+    return bytes(data)
+
+
+def Run(function, data, options):
+    oFrames = pfef.cFrames()
+    start = time.perf_counter()
+    function(oFrames, 0, data, options, False, "benchmark")
+    elapsed = time.perf_counter() - start
+    filename = os.path.join(tempfile.mkdtemp(), "benchmark.pcap")
+    oFrames.WritePCAP(filename)
+    with open(filename, "rb") as f:
+        pcap = f.read()
+    os.remove(filename)
+    return elapsed, pcap, len(oFrames.frames)
+
+
+def Main():
+    arguments = [argument for argument in sys.argv[1:] if argument != "-p"]
+    options = "-p" in sys.argv[1:]
+    size = int(arguments[0]) if arguments else 16
+    data = SyntheticData(size * 1024 * 1024)
+    elapsedReference, pcapReference, countReference = Run(ReferenceExtractIPPackets, data, options)
+    elapsed, pcap, count = Run(
+        lambda oFrames, baseAddress, data, options, duplicates, filename: pfef.ExtractIPPackets(
+            oFrames, baseAddress, data, options, duplicates, True, filename
+        ),
+        data,
+        options,
+    )
+    print(f"data: {size:d} MB, options: {options}, frames: {count:d}")
+    print(f"reference:       {elapsedReference:8.2f} s {size / elapsedReference:8.2f} MB/s")
+    print(f"ExtractIPPackets: {elapsed:7.2f} s {size / elapsed:8.2f} MB/s")
+    print(f"identical PCAP: {pcap == pcapReference and count == countReference}")
+
+
+if __name__ == "__main__":
+    Main()
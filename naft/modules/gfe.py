@@ -6,65 +6,440 @@ __original_author__ = "Didier Stevens"
 __current_authors__ = "@digitalsleuth and @G-K7"
 __date__ = "2026/06/29"
 
+import os
+import sys
+import json
+import time
+import pickle
+import signal
 import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import naft.modules.impf as impf
 import naft.modules.uf as uf
 import naft.modules.pfef as pfef
 
 
+# carving metrics per buffer, shown as a live status line and written as a JSON summary;
+# for memory-mapped files, reading happens through page faults while carving and is counted as carving time
+class cCarveStats:
+
+    # buffers after the first buffer of a file re-read overlap bytes of the buffer before them
+    def __init__(self, overlap=0):
+        self.overlap = overlap
+        self.timeStart = time.perf_counter()
+        self.buffers = []
+        self.dSignatures = {}
+        self.bytesScanned = 0
+        self.timeRead = 0.0
+        self.timeCarving = 0.0
+        self.countStored = 0
+        self.countDuplicates = 0
+
+    @classmethod
+    def Rate(cls, numerator, denominator):
+        if denominator == 0:
+            return None
+        return numerator / denominator
+
+    def AddBuffer(
+        self, filename, index, size, timeRead, timeCarving, dSignatures, oFrames
+    ):
+        countDuplicates = (
+            oFrames.countDuplicatePositions + oFrames.countDuplicateContents
+        )
+        self.buffers.append(
+            {
+                "filename": filename,
+                "index": index,
+                "size": size,
+                "timeRead": timeRead,
+                "timeCarving": timeCarving,
+                "MBps": self.Rate(size / 1024 / 1024, timeRead + timeCarving),
+                "signatures": dSignatures,
+                "framesKept": oFrames.countStored - self.countStored,
+                "framesDeduplicated": countDuplicates - self.countDuplicates,
+            }
+        )
+        self.countStored = oFrames.countStored
+        self.countDuplicates = countDuplicates
+        if index == 0:
+            self.bytesScanned += size
+        else:
+            self.bytesScanned += max(0, size - self.overlap)
+        self.timeRead += timeRead
+        self.timeCarving += timeCarving
+        for name, dCounts in dSignatures.items():
+            if name not in self.dSignatures:
+                self.dSignatures[name] = {key: 0 for key in dCounts}
+            for key, count in dCounts.items():
+                self.dSignatures[name][key] += count
+
+    def StatusLine(self):
+        elapsed = time.perf_counter() - self.timeStart
+        MBps = self.Rate(self.bytesScanned / 1024 / 1024, elapsed) or 0.0
+        line = f"{self.bytesScanned / 1024 / 1024:.2f} MB {MBps:.2f} MB/s"
+        for name, dCounts in self.dSignatures.items():
+            line += f" {name} {dCounts['candidates']:d}/{dCounts['examined']:d}/{dCounts['valid']:d}/{dCounts['matched']:d}"
+        line += f" kept {self.countStored:d} deduplicated {self.countDuplicates:d}"
+        line += f" read {self.timeRead:.1f}s carving {self.timeCarving:.1f}s"
+        return line
+
+    def ShowStatusLine(self):
+        print(self.StatusLine(), end="\r", file=sys.stderr)
+
+    def Summary(self, oFrames):
+        elapsed = time.perf_counter() - self.timeStart
+        dSignatures = {}
+        for name, dCounts in self.dSignatures.items():
+            dSignatures[name] = dict(dCounts)
+            dSignatures[name]["passRate"] = self.Rate(
+                dCounts["valid"], dCounts["examined"]
+            )
+        return {
+            "bytesScanned": self.bytesScanned,
+            "time": elapsed,
+            "timeRead": self.timeRead,
+            "timeCarving": self.timeCarving,
+            "MBps": self.Rate(self.bytesScanned / 1024 / 1024, elapsed),
+            "signatures": dSignatures,
+            "framesIdentified": oFrames.countFrames,
+            "packetsIdentified": oFrames.countPackets,
+            "framesKept": oFrames.countStored,
+            "framesDeduplicatedPosition": oFrames.countDuplicatePositions,
+            "framesDeduplicatedContent": oFrames.countDuplicateContents,
+            "framesExportedBefore": oFrames.countExported,
+            "buffers": self.buffers,
+        }
+
+    def WriteJSON(self, filename, oFrames):
+        return WriteJSON(self.Summary(oFrames), filename)
+
+
+# worker process: carve one buffer of a memory-mapped file
+def CarveBuffer(filename, start, end, options, ouiPrefixes, oFilter):
+    timeStart = time.perf_counter()
+    oCarvedFrames = pfef.cCarvedFrames(ouiPrefixes, oFilter)
+    dStats = {}
+    pfef.ExtractFrames(
+        oCarvedFrames,
+        start,
+        memoryview(uf.MapFile(filename))[start:end],
+        options,
+        True,
+        True,
+        filename,
+        dStats,
+    )
+    return oCarvedFrames.carved, dStats, time.perf_counter() - timeStart
+
+
+# Ctrl-C is handled by the main process, which stops at a buffer boundary
+def IgnoreInterrupt():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+# carve the buffers of a file in a process pool; results are returned in buffer order,
+# with at most 2 buffers per job carved ahead of the buffer being returned; with resumeEnd,
+# carving starts after the buffer ending at that offset
+def CarveBuffersParallel(
+    filename,
+    buffersize,
+    bufferoverlapsize,
+    options,
+    ouiPrefixes,
+    oFilter,
+    jobs,
+    resumeEnd=None,
+):
+    with ProcessPoolExecutor(jobs, initializer=IgnoreInterrupt) as pool:
+        pending = deque()
+        for start, end in uf.BufferWindows(
+            os.path.getsize(filename), buffersize, bufferoverlapsize
+        ):
+            if resumeEnd is not None and end <= resumeEnd:
+                continue
+            pending.append(
+                (
+                    start,
+                    end,
+                    pool.submit(
+                        CarveBuffer, filename, start, end, options, ouiPrefixes, oFilter
+                    ),
+                )
+            )
+            if len(pending) >= 2 * jobs:
+                start, end, future = pending.popleft()
+                yield start, end, future.result()
+        while pending:
+            start, end, future = pending.popleft()
+            yield start, end, future.result()
+
+
+def WriteJSON(dSummary, filename):
+    try:
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(dSummary, f, indent=2)
+    except:
+        return False
+    return True
+
+
+def PrintSummary(dSummary):
+    dProtocolNames = {number: name for name, number in pfef.cFrameFilter.PROTOCOLS.items()}
+    print("Frames:")
+    for carveType, count in dSummary["frames"].items():
+        print(f" {carveType:<10} {count:10d}")
+    print("IP protocols:")
+    for protocol, count in sorted(dSummary["protocols"].items(), key=lambda x: -x[1]):
+        print(f" {dProtocolNames.get(protocol, str(protocol)):<10} {count:10d}")
+    for name, ports in dSummary["ports"].items():
+        print(f"Top {name.upper()} ports:")
+        for port, count in ports.items():
+            print(f" {port:<10d} {count:10d}")
+    if dSummary["vlans"]:
+        print("VLAN IDs:")
+        for vlan, count in dSummary["vlans"].items():
+            print(f" {vlan:<10d} {count:10d}")
+    print("Top talkers (bytes):")
+    for address, count in dSummary["talkers"].items():
+        print(f" {address:<15} {count:10d}")
+    if dSummary["arpConflicts"]:
+        print("IP addresses bound to more than one MAC address by ARP:")
+        for address, macs in dSummary["arpConflicts"].items():
+            print(f" {address:<15} {' '.join(macs)}")
+
+
+# pcapng with provenance comments when the filename ends with .pcapng, classic pcap otherwise
+def WriteFrames(oFrames, filenamePCAP):
+    if filenamePCAP.lower().endswith(".pcapng"):
+        return oFrames.WritePCAPNG(filenamePCAP)
+    return oFrames.WritePCAP(filenamePCAP)
+
+
+# periodic checkpoints of ExtractIPPacketsFromFile, saved after a completed buffer; SIGINT and SIGTERM
+# stop the extraction after the current buffer with a final checkpoint
+class cCheckpoint:
+
+    INTERVAL = 60
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.timeSaved = time.perf_counter()
+        self.stop = False
+        if filename is not None:
+            signal.signal(signal.SIGINT, self.Stop)
+            signal.signal(signal.SIGTERM, self.Stop)
+
+    def Stop(self, signum, frame):
+        self.stop = True
+
+    # the frames still in memory are spilled to a run next to the checkpoint, the pickle holds the run filenames
+    def Save(self, dState, force=False):
+        if self.filename is None:
+            return True
+        if not force and time.perf_counter() - self.timeSaved < self.INTERVAL:
+            return True
+        dState["oFrames"].SpillFrames()
+        try:
+            with open(self.filename + ".tmp", "wb") as fPickle:
+                pickle.dump(dState, fPickle)
+            os.replace(self.filename + ".tmp", self.filename)
+        except:
+            return False
+        self.timeSaved = time.perf_counter()
+        return True
+
+    @classmethod
+    def Load(cls, filename):
+        try:
+            with open(filename, "rb") as fPickle:
+                return pickle.load(fPickle)
+        except:
+            return None
+
+    def Remove(self):
+        if self.filename is not None and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
 def ExtractIPPacketsFromFile(filenamesRawData, filenamePCAP, arguments):
     uf.LogLine("Start")
-    if arguments["ouitxt"] is None:
-        oFrames = pfef.cFrames()
+    if arguments["resume"] is not None:
+        dState = cCheckpoint.Load(arguments["resume"])
+        if dState is None:
+            uf.LogLine(f"Error reading checkpoint {arguments['resume']}")
+            return
+        uf.LogLine(f"Resuming from checkpoint {arguments['resume']}")
+        # carve with the settings of the interrupted extraction, and keep checkpointing to the same file
+        arguments = {
+            **dState["arguments"],
+            "checkpoint": arguments["checkpoint"] or arguments["resume"],
+            "resume": arguments["resume"],
+        }
+        filenamesRawData = dState["filenames"]
+        oFrames = dState["oFrames"]
     else:
-        oFrames = pfef.cFrames(arguments["ouitxt"])
-    countProcessedFiles = 0
-    for filenameRawData in filenamesRawData:
-        if arguments["buffer"]:
+        if arguments["memory"] is None:
+            memoryBudget = None
+        else:
+            memoryBudget = arguments["memory"] * 1024 * 1024
+        oFrames = pfef.cFrames(
+            arguments["ouitxt"],
+            memoryBudget,
+            arguments["exported"],
+            arguments["filter"],
+            arguments["summary"],
+        )
+        if oFrames.oDedupIndex.err is not None:
+            uf.LogLine(oFrames.oDedupIndex.err)
+            return
+        if oFrames.oFilter is not None and oFrames.oFilter.err is not None:
+            uf.LogLine(oFrames.oFilter.err)
+            return
+        dState = {
+            "arguments": arguments,
+            "filenames": filenamesRawData,
+            "file": 0,
+            "end": None,
+            "countProcessedFiles": 0,
+            "oFrames": oFrames,
+        }
+    oCheckpoint = cCheckpoint(arguments["checkpoint"])
+    if arguments["checkpoint"] is not None:
+        oFrames.runDirectory = os.path.dirname(os.path.abspath(arguments["checkpoint"]))
+    oCarveStats = cCarveStats(arguments["bufferoverlapsize"] * 1024 * 1024)
+
+    # after each carved buffer; False to stop carving
+    def BufferCarved(filename, index, size, end, timeRead, timeCarving, dStats):
+        oCarveStats.AddBuffer(
+            filename, index, size, timeRead, timeCarving, dStats, oFrames
+        )
+        if arguments["stats"] is not None:
+            oCarveStats.ShowStatusLine()
+        dState["end"] = end
+        if not oCheckpoint.Save(dState):
+            uf.LogLine(f"Error writing checkpoint {arguments['checkpoint']}")
+        return not oCheckpoint.stop
+
+    while dState["file"] < len(filenamesRawData) and not oCheckpoint.stop:
+        filenameRawData = filenamesRawData[dState["file"]]
+        resumeEnd = dState["end"]
+        if arguments["jobs"] > 1 and not uf.IsCompressedFile(filenameRawData):
+            uf.LogLine(
+                f"Buffering file {filenameRawData} with {arguments['jobs']:d} jobs"
+            )
+            try:
+                filesize = os.path.getsize(filenameRawData)
+                for start, end, (carved, dStats, timeCarving) in CarveBuffersParallel(
+                    filenameRawData,
+                    arguments["buffersize"] * 1024 * 1024,
+                    arguments["bufferoverlapsize"] * 1024 * 1024,
+                    arguments["options"],
+                    oFrames.ouiPrefixes,
+                    oFrames.oFilter,
+                    arguments["jobs"],
+                    resumeEnd,
+                ):
+                    uf.LogLine(
+                        f"Processing buffer 0x{start:x} size {(end - start)/1024/1024:.2f} MB {int(end * 100.0 / filesize):d}%"
+                    )
+                    timeStart = time.perf_counter()
+                    oFrames.Window(end, arguments["bufferoverlapsize"] * 1024 * 1024)
+                    oFrames.AddCarved(carved, arguments["duplicates"], filenameRawData)
+                    if not BufferCarved(
+                        filenameRawData,
+                        start,
+                        end - start,
+                        end,
+                        0.0,
+                        timeCarving + time.perf_counter() - timeStart,
+                        dStats,
+                    ):
+                        break
+            except MemoryError:
+                uf.LogLine("Data is too large to fit in memory, use smaller buffer")
+            except BrokenProcessPool:
+                uf.LogLine(
+                    "A carving process ended abruptly, e.g. out of memory, use smaller buffer or fewer jobs"
+                )
+                dState["file"] += 1
+                dState["end"] = None
+                continue
+            except OSError:
+                uf.LogLine("Error reading file")
+                dState["file"] += 1
+                dState["end"] = None
+                continue
+        # compressed files are always decompressed in buffers
+        elif arguments["buffer"] or uf.IsCompressedFile(filenameRawData):
             uf.LogLine(f"Buffering file {filenameRawData}")
-            oBufferFile = uf.cBufferFile(
+            oBufferFile = uf.BufferFile(
                 filenameRawData,
                 arguments["buffersize"] * 1024 * 1024,
                 arguments["bufferoverlapsize"] * 1024 * 1024,
+                arguments["prefetch"],
             )
-            while oBufferFile.Read():
+            if resumeEnd is not None:
+                oBufferFile.Skip(resumeEnd)
+            while not oBufferFile.err:
+                timeStart = time.perf_counter()
+                if not oBufferFile.Read():
+                    break
+                timeRead = time.perf_counter() - timeStart
+                if oBufferFile.index == 0 and oBufferFile.name != filenameRawData:
+                    uf.LogLine(f"Decompressing {oBufferFile.name}")
                 uf.LogLine(
                     f"Processing buffer 0x{oBufferFile.index:x} size {len(oBufferFile.buffer)/1024/1024:.2f} MB {oBufferFile.Progress():d}%"
                 )
-                uf.LogLine("Searching for IPv4 packets")
-                pfef.ExtractIPPackets(
+                uf.LogLine("Searching for IPv4 packets and ARP Ethernet frames")
+                timeStart = time.perf_counter()
+                dStats = {}
+                oFrames.Window(
+                    oBufferFile.index + len(oBufferFile.buffer),
+                    arguments["bufferoverlapsize"] * 1024 * 1024,
+                )
+                pfef.ExtractFrames(
                     oFrames,
                     oBufferFile.index,
                     oBufferFile.buffer,
                     arguments["options"],
                     arguments["duplicates"],
                     True,
-                    filenameRawData,
+                    oBufferFile.name,
+                    dStats,
                 )
-                uf.LogLine("Searching for ARP Ethernet frames")
-                pfef.ExtractARPFrames(
-                    oFrames,
+                if not BufferCarved(
+                    oBufferFile.name,
                     oBufferFile.index,
-                    oBufferFile.buffer,
-                    arguments["duplicates"],
-                    True,
-                    filenameRawData,
-                )
+                    len(oBufferFile.buffer),
+                    oBufferFile.bytesread,
+                    timeRead,
+                    time.perf_counter() - timeStart,
+                    dStats,
+                ):
+                    break
+            oBufferFile.Close()
             if oBufferFile.err == MemoryError:
                 uf.LogLine("Data is too large to fit in memory, use smaller buffer")
             elif oBufferFile.err:
                 uf.LogLine("Error reading file")
-            countProcessedFiles += 1
         else:
             uf.LogLine(f"Reading file {filenameRawData}")
-            rawData = uf.File2Data(filenameRawData)
+            timeStart = time.perf_counter()
+            rawData = uf.File2MappedData(filenameRawData)
+            timeRead = time.perf_counter() - timeStart
             if rawData is None:
                 uf.LogLine("Error reading file")
-            if rawData == MemoryError:
+            elif rawData == MemoryError:
                 uf.LogLine("File is too large to fit in memory")
             else:
-                uf.LogLine("Searching for IPv4 packets")
-                pfef.ExtractIPPackets(
+                uf.LogLine("Searching for IPv4 packets and ARP Ethernet frames")
+                timeStart = time.perf_counter()
+                dStats = {}
+                oFrames.Window(len(rawData), 0)
+                pfef.ExtractFrames(
                     oFrames,
                     0,
                     rawData,
@@ -72,19 +447,76 @@ def ExtractIPPacketsFromFile(filenamesRawData, filenamePCAP, arguments):
                     arguments["duplicates"],
                     True,
                     filenameRawData,
+                    dStats,
                 )
-                uf.LogLine("Searching for ARP Ethernet frames")
-                pfef.ExtractARPFrames(
-                    oFrames, 0, rawData, arguments["duplicates"], True, filenameRawData
+                BufferCarved(
+                    filenameRawData,
+                    0,
+                    len(rawData),
+                    len(rawData),
+                    timeRead,
+                    time.perf_counter() - timeStart,
+                    dStats,
                 )
-                countProcessedFiles += 1
-    if countProcessedFiles > 0:
-        uf.LogLine(f"Writing PCAP file {filenamePCAP}")
-        if not oFrames.WritePCAP(filenamePCAP):
-            uf.LogLine("Error writing PCAP file")
+                dState["countProcessedFiles"] += 1
+            dState["file"] += 1
+            dState["end"] = None
+            continue
+        if oCheckpoint.stop:
+            break
+        dState["countProcessedFiles"] += 1
+        dState["file"] += 1
+        dState["end"] = None
+    if oCheckpoint.stop:
+        print("", file=sys.stderr)
+        if oCheckpoint.Save(dState, True):
+            uf.LogLine(
+                f"Interrupted, continue with --resume {arguments['checkpoint']}"
+            )
+        else:
+            uf.LogLine(f"Error writing checkpoint {arguments['checkpoint']}")
+        return
+    written = True
+    if dState["countProcessedFiles"] > 0:
+        if oFrames.oSummary is not None:
+            dSummary = oFrames.oSummary.Summary()
+            PrintSummary(dSummary)
+            filenameSummary = os.path.splitext(filenamePCAP)[0] + ".json"
+            uf.LogLine(f"Writing summary file {filenameSummary}")
+            if not WriteJSON(dSummary, filenameSummary):
+                uf.LogLine("Error writing summary file")
+        else:
+            uf.LogLine(f"Writing PCAP file {filenamePCAP}")
+            written = WriteFrames(oFrames, filenamePCAP)
+            if not written:
+                uf.LogLine("Error writing PCAP file")
+            elif arguments["exported"] is not None:
+                uf.LogLine(f"Writing exported frames file {arguments['exported']}")
+                if not oFrames.oDedupIndex.Save():
+                    uf.LogLine("Error writing exported frames file")
         uf.LogLine(f"Number of identified frames:   {oFrames.countFrames:5d}")
         uf.LogLine(f"Number of identified packets:  {oFrames.countPackets:5d}")
-        uf.LogLine(f"Number of frames in PCAP file: {len(oFrames.frames):5d}")
+        if oFrames.oSummary is not None:
+            uf.LogLine(f"Number of frames summarized:   {oFrames.countStored:5d}")
+        else:
+            uf.LogLine(f"Number of frames in PCAP file: {oFrames.countStored:5d}")
+        if arguments["exported"] is not None:
+            uf.LogLine(f"Number of frames exported before: {oFrames.countExported:5d}")
+        if arguments["stats"] is not None:
+            print("", file=sys.stderr)
+            uf.LogLine(oCarveStats.StatusLine())
+            uf.LogLine(f"Writing statistics file {arguments['stats']}")
+            if not oCarveStats.WriteJSON(arguments["stats"], oFrames):
+                uf.LogLine("Error writing statistics file")
+    # the checkpoint and the spilled runs it refers to are kept to write the PCAP file again with --resume
+    if not written and arguments["checkpoint"] is not None:
+        if oCheckpoint.Save(dState, True):
+            uf.LogLine(f"Write the PCAP file again with --resume {arguments['checkpoint']}")
+        else:
+            uf.LogLine(f"Error writing checkpoint {arguments['checkpoint']}")
+    else:
+        oCheckpoint.Remove()
+        oFrames.RemoveRuns()
     uf.LogLine("Done")
 
 
@@ -103,7 +535,7 @@ def IOSFrames(coredumpFilename, filenameIOMEM, filenamePCAP, arguments):
     oIOSMemoryParserHeap = impf.cIOSMemoryParser(memoryHeap)
     oIOSMemoryParserHeap.ResolveNames(oIOSCoreDump)
     uf.LogLine(f"Reading file {filenameIOMEM}")
-    dataIOMEM = uf.File2Data(filenameIOMEM)
+    dataIOMEM = uf.File2MappedData(filenameIOMEM)
     uf.LogLine(f"Searching for base address from {filenameIOMEM}")
     oIOSMemoryParserIOMEM = impf.cIOSMemoryParser(dataIOMEM)
     addressIOMEM = oIOSMemoryParserIOMEM.baseAddress
@@ -144,7 +576,8 @@ def IOSFrames(coredumpFilename, filenameIOMEM, filenamePCAP, arguments):
                         + frameSize
                     ],
                     True,
+                    filenameIOMEM,
                 )
-    oFrames.WritePCAP(filenamePCAP)
+    WriteFrames(oFrames, filenamePCAP)
     uf.LogLine(f"{oFrames.countFrames:d} frames written to {filenamePCAP}")
     uf.LogLine("Done")
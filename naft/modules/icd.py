@@ -6,9 +6,12 @@ __original_author__ = "Didier Stevens"
 __current_authors__ = "@digitalsleuth and @G-K7"
 __date__ = "2026/06/29"
 
+import sys
 import struct
 import re
 import os
+import traceback
+import contextlib
 from datetime import datetime
 import naft.modules.uf as uf
 import naft.modules.impf as impf
@@ -16,8 +19,8 @@ import naft.modules.pfef as pfef
 import naft.modules.iipf as iipf
 
 
-def IOSRegions(coredumpFilename, arguments):
-    oIOSCoreDump = impf.cIOSCoreDump(coredumpFilename)
+def IOSRegions(coredumpFilename, arguments, oIOSCoreDump=None):
+    oIOSCoreDump = CoreDump(coredumpFilename, arguments, oIOSCoreDump)
     if oIOSCoreDump.err is not None:
         print(oIOSCoreDump.err)
     else:
@@ -38,6 +41,18 @@ def IOSRegions(coredumpFilename, arguments):
         addressBSS, dataBSS = oIOSCoreDump.RegionBSS()
 
 
+# the parsed core dump index is used unless --noindex
+def UseIndex(arguments):
+    return arguments is not None and not arguments.get("noindex", True)
+
+
+# the core dump parsed once for a batch, or else parsed for one function
+def CoreDump(coredumpFilename, arguments, oIOSCoreDump=None):
+    if oIOSCoreDump is None:
+        oIOSCoreDump = impf.cIOSCoreDump(coredumpFilename, UseIndex(arguments))
+    return oIOSCoreDump
+
+
 def File2Strings(filename):
     try:
         with open(filename, "r", encoding="utf-8") as f:
@@ -46,13 +61,13 @@ def File2Strings(filename):
         return None
 
 
+# the lines of file with @file, None for a file that can't be read
 def ProcessAt(argument):
     if argument.startswith("@"):
         strings = File2Strings(argument[1:])
         if strings is None:
-            raise Exception(f"Error reading {argument}")
-        else:
-            return strings
+            print(f"Error reading file {argument[1:]}")
+        return strings
     return [argument]
 
 
@@ -96,23 +111,22 @@ def ProcessHeap(oIOSMemoryBlockHeader, arguments, coredumpFilename, output_path=
             )
 
 
-def IOSHeap(coredumpFilename, arguments):
+def IOSHeap(coredumpFilename, arguments, oIOSCoreDump=None):
     if arguments["output"] is not None:
         output_path = os.path.join(arguments["output"], "heap_data")
         os.mkdir(output_path)
     else:
         output_path = ""
-    oIOSCoreDump = impf.cIOSCoreDump(coredumpFilename)
+    oIOSCoreDump = CoreDump(coredumpFilename, arguments, oIOSCoreDump)
     if oIOSCoreDump.err is not None:
         print(oIOSCoreDump.err)
         return
-    addressHeap, memoryHeap = oIOSCoreDump.RegionHEAP()
-    if memoryHeap is None:
+    oIOSMemoryParser = oIOSCoreDump.HeapParser(
+        arguments["resolve"] or arguments["filter"] != ""
+    )
+    if oIOSMemoryParser is None:
         print("Heap region not found")
         return
-    oIOSMemoryParser = impf.cIOSMemoryParser(memoryHeap)
-    if arguments["resolve"] or arguments["filter"] != "":
-        oIOSMemoryParser.ResolveNames(oIOSCoreDump)
     if arguments["filter"] == "":
         print(impf.cIOSMemoryBlockHeader.ShowHeader)
         for oIOSMemoryBlockHeader in oIOSMemoryParser.Headers:
@@ -143,7 +157,7 @@ def IOSCWStringsSub(data):
             )
 
 
-def IOSCWStrings(coredumpFilename, arguments):
+def IOSCWStrings(coredumpFilename, arguments, oIOSCoreDump=None):
     if arguments["raw"]:
         coredump = uf.File2Data(coredumpFilename)
         if coredump is None:
@@ -151,7 +165,7 @@ def IOSCWStrings(coredumpFilename, arguments):
         else:
             IOSCWStringsSub(coredump)
     else:
-        oIOSCoreDump = impf.cIOSCoreDump(coredumpFilename)
+        oIOSCoreDump = CoreDump(coredumpFilename, arguments, oIOSCoreDump)
         if oIOSCoreDump.err is not None:
             print(oIOSCoreDump.err)
             return
@@ -162,43 +176,25 @@ def IOSCWStrings(coredumpFilename, arguments):
         IOSCWStringsSub(memoryData)
 
 
-def PrintStatsAnalysis(dStats, oIOSCoreDump):
-    keys1 = list(dStats.keys())
-    keys1.sort()
-    for key1 in keys1:
-        countKeys = len(dStats[key1])
-        keys2 = list(dStats[key1].keys())
-        keys2.sort()
+def PrintStatsAnalysis(dAnalysis):
+    for key1 in sorted(dAnalysis):
+        countKeys, minimum, filteredMin, unfilteredMax, regionNames, dCounts = dAnalysis[key1]
         if 2 < countKeys <= 7:
             bucket = "-> " + " ".join(
-                [f"{key2:X}:{dStats[key1][key2]:d}" for key2 in keys2]
+                [f"{key2:X}:{dCounts[key2]:d}" for key2 in sorted(dCounts)]
             )
         else:
             bucket = ""
-        filtered = [x for x in dStats[key1] if x != 0]
-        if filtered == []:
-            filteredMin = min(dStats[key1])
-        else:
-            filteredMin = min(filtered)
-        unfilteredMax = max(dStats[key1])
-        regionNames = []
-        for region in oIOSCoreDump.regions:
-            if region[2] is not None:
-                if (
-                    region[1] <= filteredMin <= region[1] + region[2] - 1
-                    or region[1] <= unfilteredMax <= region[1] + region[2] - 1
-                ):
-                    if region[0] not in regionNames:
-                        regionNames.append(region[0])
-        regionNames.sort()
         regionName = " ".join(regionNames).strip()
         print(
-            f"{key1:3d} {(key1*4):3X}: {countKeys:3d} {min(dStats[key1]):08X} {filteredMin:08X} {unfilteredMax:08X} {regionName} {bucket}"
+            f"{key1:3d} {(key1*4):3X}: {countKeys:3d} {minimum:08X} {filteredMin:08X} {unfilteredMax:08X} {regionName} {bucket}"
         )
 
 
-def IOSProcesses(coredumpFilename, arguments):
-    oIOSCoreDumpAnalysis = impf.cIOSCoreDumpAnalysis(coredumpFilename)
+def IOSProcesses(coredumpFilename, arguments, oIOSCoreDump=None):
+    oIOSCoreDumpAnalysis = impf.cIOSCoreDumpAnalysis(
+        coredumpFilename, UseIndex(arguments), oIOSCoreDump, arguments["layoutdb"]
+    )
     if oIOSCoreDumpAnalysis.err is not None:
         print(oIOSCoreDumpAnalysis.err)
         return
@@ -240,46 +236,149 @@ def IOSProcesses(coredumpFilename, arguments):
         for key in keys:
             value = oIOSCoreDumpAnalysis.HeuristicsFields[key]
             if value is not None:
-                print(f"{key:-22s}: 0x{value[1]:04X}")
+                print(f"{key:<22s}: 0x{value[1]:04X}")
+        if oIOSCoreDumpAnalysis.LearnedBuild is not None:
+            print(
+                f"Fields saved for {oIOSCoreDumpAnalysis.LearnedBuild} in {oIOSCoreDumpAnalysis.LearnedFilename}"
+            )
+    elif oIOSCoreDumpAnalysis.LearnedBuild is not None:
+        print("")
+        print(
+            f"Process structure decoded with fields learned for {oIOSCoreDumpAnalysis.LearnedBuild} in {oIOSCoreDumpAnalysis.LearnedFilename}"
+        )
     if arguments["stats"]:
         keys = list(oIOSCoreDumpAnalysis.dProcessStructureStats.keys())
         keys.sort()
         print(f"Number of different process structures: {len(keys):d}")
         for index in keys:
             print(f"Process structures length: {index:d}")
-            PrintStatsAnalysis(
-                oIOSCoreDumpAnalysis.dProcessStructureStats[index],
-                oIOSCoreDumpAnalysis.oIOSCoreDump,
-            )
+            PrintStatsAnalysis(oIOSCoreDumpAnalysis.StructureAnalysis(index))
+
+
+# hexadecimal addresses separated by commas, or read from a file with @file; None for an invalid address or file
+def ParseAddresses(argument):
+    addresses = []
+    for argumentAt in argument.split(","):
+        lines = ProcessAt(argumentAt.strip())
+        if lines is None:
+            return None
+        for line in lines:
+            for address in line.replace(",", " ").split():
+                try:
+                    addresses.append(int(address, 16))
+                except ValueError:
+                    print(f"Invalid address {address}")
+                    return None
+    return addresses
+
+
+# the names of the processes by process ID
+def ProcessNames(coredumpFilename, arguments, oIOSCoreDump):
+    dProcessNames = {}
+    oIOSCoreDumpAnalysis = impf.cIOSCoreDumpAnalysis(
+        coredumpFilename, UseIndex(arguments), oIOSCoreDump, arguments["layoutdb"]
+    )
+    if oIOSCoreDumpAnalysis.err is None:
+        for processID, addressProcess, oIOSProcess in oIOSCoreDumpAnalysis.processes:
+            if oIOSProcess is not None and oIOSProcess.err == "":
+                dProcessNames[processID] = oIOSProcess.name
+    return dProcessNames
+
+
+WHEREIS_HEADER = "Address  Region Block    Offset    PID Process              What"
 
 
-def FilterInitBlocksForString(coredumpFilename, searchTerm):
-    oIOSCoreDump = impf.cIOSCoreDump(coredumpFilename)
+def WhereIsLine(address, oIOSCoreDump, oIOSMemoryParser, dProcessNames):
+    line = f"{address:08X} {oIOSCoreDump.FindRegion(address) or '-':<6} "
+    oIOSMemoryBlockHeader = oIOSMemoryParser.FindBlock(address)
+    if oIOSMemoryBlockHeader is None:
+        return line.rstrip()
+    if oIOSMemoryBlockHeader.AllocNameResolved in ("", None):
+        allocName = f"{oIOSMemoryBlockHeader.AllocName:08X}"
+    else:
+        allocName = oIOSMemoryBlockHeader.AllocNameResolved
+    if oIOSMemoryBlockHeader.BlockFree:
+        allocName += " (free)"
+    line += f"{oIOSMemoryBlockHeader.address:08X} {(address - oIOSMemoryBlockHeader.address):08X} "
+    line += f"{oIOSMemoryBlockHeader.PID:4d} {dProcessNames.get(oIOSMemoryBlockHeader.PID) or '':<20} "
+    return line + allocName
+
+
+# the region, heap block, owner process and AllocName of each address
+def IOSWhereIs(coredumpFilename, arguments, oIOSCoreDump=None):
+    addresses = ParseAddresses(arguments["whereis"])
+    if addresses is None:
+        return
+    oIOSCoreDump = CoreDump(coredumpFilename, arguments, oIOSCoreDump)
     if oIOSCoreDump.err is not None:
-        return []
-    addressHeap, memoryHeap = oIOSCoreDump.RegionHEAP()
-    if memoryHeap is None:
+        print(oIOSCoreDump.err)
+        return
+    oIOSMemoryParser = oIOSCoreDump.HeapParser(True)
+    if oIOSMemoryParser is None:
         print("Heap region not found")
+        return
+    dProcessNames = ProcessNames(coredumpFilename, arguments, oIOSCoreDump)
+    print(WHEREIS_HEADER)
+    for address in addresses:
+        print(WhereIsLine(address, oIOSCoreDump, oIOSMemoryParser, dProcessNames))
+
+
+# the addresses in the heap, data and bss regions pointing into the heap block of each address
+def IOSPointers(coredumpFilename, arguments, oIOSCoreDump=None):
+    addresses = ParseAddresses(arguments["pointers"])
+    if addresses is None:
+        return
+    oIOSCoreDump = CoreDump(coredumpFilename, arguments, oIOSCoreDump)
+    if oIOSCoreDump.err is not None:
+        print(oIOSCoreDump.err)
+        return
+    oIOSMemoryParser = oIOSCoreDump.HeapParser(True)
+    if oIOSMemoryParser is None:
+        print("Heap region not found")
+        return
+    oIOSPointerIndex = oIOSCoreDump.PointerIndex(oIOSMemoryParser)
+    dProcessNames = ProcessNames(coredumpFilename, arguments, oIOSCoreDump)
+    for address in addresses:
+        oIOSMemoryBlockHeader = oIOSMemoryParser.FindBlock(address)
+        if oIOSMemoryBlockHeader is None:
+            print(f"{address:08X}: no heap block")
+            continue
+        sources = oIOSPointerIndex.Sources(oIOSMemoryBlockHeader.row)
+        print(f"{address:08X}: block {oIOSMemoryBlockHeader.address:08X}, {len(sources):d} pointers")
+        if len(sources) > 0:
+            print(WHEREIS_HEADER)
+            for source in sources:
+                print(WhereIsLine(source, oIOSCoreDump, oIOSMemoryParser, dProcessNames))
+
+
+# the strings of the Init blocks are searched once per core dump
+def FilterInitBlocksForString(oIOSCoreDump, searchTerm):
+    if oIOSCoreDump.err is not None:
         return []
-    oIOSMemoryParser = impf.cIOSMemoryParser(memoryHeap)
-    oIOSMemoryParser.ResolveNames(oIOSCoreDump)
-    found = []
-    for oIOSMemoryBlockHeader in oIOSMemoryParser.Headers:
-        if oIOSMemoryBlockHeader.AllocNameResolved == "Init":
-            dStrings = uf.SearchASCIIStrings(oIOSMemoryBlockHeader.GetData())
-            for value in dStrings.values():
-                if value.find(searchTerm) >= 0:
-                    found.append(value)
-    return found
+    if oIOSCoreDump.Get("init") is None:
+        oIOSMemoryParser = oIOSCoreDump.HeapParser(True)
+        if oIOSMemoryParser is None:
+            print("Heap region not found")
+            return []
+        strings = []
+        for oIOSMemoryBlockHeader in oIOSMemoryParser.Headers:
+            if oIOSMemoryBlockHeader.AllocNameResolved == "Init":
+                strings.extend(
+                    uf.SearchASCIIStrings(oIOSMemoryBlockHeader.GetData()).values()
+                )
+        oIOSCoreDump.Set("init", strings)
+    return [value for value in oIOSCoreDump.Get("init") if value.find(searchTerm) >= 0]
 
 
-def IOSHistory(coredumpFilename, arguments=None):
+def IOSHistory(coredumpFilename, arguments=None, oIOSCoreDump=None):
     history = []
     hist_time_format = "%b %d %Y %H:%M:%S.%f %Z"
     CMD_PATTERN = re.compile(
         rb"CMD: '(.+?)' " rb"(\d{2}:\d{2}:\d{2} \S+ \S+ \S+ \d{1,2} \d{4})"
     )
-    for command in FilterInitBlocksForString(coredumpFilename, b"CMD: "):
+    for command in FilterInitBlocksForString(
+        CoreDump(coredumpFilename, arguments, oIOSCoreDump), b"CMD: "
+    ):
         oMatch = CMD_PATTERN.search(command)
         if oMatch:
             timestamp = oMatch.group(2).decode("utf-8")
@@ -293,13 +392,15 @@ def IOSHistory(coredumpFilename, arguments=None):
         print(f"{formatted_time}: {command[1]}")
 
 
-def IOSEvents(coredumpFilename, arguments=None):
+def IOSEvents(coredumpFilename, arguments=None, oIOSCoreDump=None):
     events = []
     evt_time_format = "%b %d %Y %H:%M:%S.%f"
     EVT_PATTERN = re.compile(
         rb"([\w\s\d:]+\.\d{3,6})(.*)"
     )
-    for raw_event in FilterInitBlocksForString(coredumpFilename, b": %"):
+    for raw_event in FilterInitBlocksForString(
+        CoreDump(coredumpFilename, arguments, oIOSCoreDump), b": %"
+    ):
         decoded_event = raw_event.decode("utf-8")
         clean_event, cmd_string, _ = decoded_event.partition("CMD:")
         oMatch = EVT_PATTERN.search(clean_event.encode("utf-8"))
@@ -316,9 +417,9 @@ def IOSEvents(coredumpFilename, arguments=None):
         print(f"{formatted_time}: {event[1]}")
 
 
-def IOSCheckText(coredumpFilename, imageFilename, arguments):
+def IOSCheckText(coredumpFilename, imageFilename, arguments, oIOSCoreDump=None):
     print("Comparing CW_SYSDESCR between core dump and IOS image")
-    oIOSCoreDump = impf.cIOSCoreDump(coredumpFilename)
+    oIOSCoreDump = CoreDump(coredumpFilename, arguments, oIOSCoreDump)
     if oIOSCoreDump.err is not None:
         print(oIOSCoreDump.err)
         return
@@ -404,16 +505,15 @@ def IOSCheckText(coredumpFilename, imageFilename, arguments):
         )
 
 
-def IOSIntegrityText(coredumpFilename, arguments):
-    oIOSCoreDump = impf.cIOSCoreDump(coredumpFilename)
+def IOSIntegrityText(coredumpFilename, arguments, oIOSCoreDump=None):
+    oIOSCoreDump = CoreDump(coredumpFilename, arguments, oIOSCoreDump)
     if oIOSCoreDump.err is not None:
         print(oIOSCoreDump.err)
         return
-    addressHeap, memoryHeap = oIOSCoreDump.RegionHEAP()
-    if memoryHeap is None:
+    oIOSMemoryParser = oIOSCoreDump.HeapParser()
+    if oIOSMemoryParser is None:
         print("Heap region not found")
         return
-    oIOSMemoryParser = impf.cIOSMemoryParser(memoryHeap)
     print("Check start magic:")
     hit = False
     for oIOSMemoryBlockHeader in oIOSMemoryParser.Headers:
@@ -450,3 +550,75 @@ def IOSIntegrityText(coredumpFilename, arguments):
             hit = True
     if not hit:
         print("OK")
+
+
+BATCH_FUNCTIONS = (
+    "regions",
+    "cwstrings",
+    "heap",
+    "history",
+    "events",
+    "processes",
+    "integrity",
+    "check",
+)
+
+
+# False after printing an error for unknown functions, check without -b/--bin or a path that is not a directory
+def IOSBatchArguments(path, arguments):
+    functions = [function.strip().lower() for function in arguments["functions"].split(",")]
+    for function in functions:
+        if function not in BATCH_FUNCTIONS:
+            print(f"Unknown function {function}, use {','.join(BATCH_FUNCTIONS)}")
+            return False
+    if "check" in functions and not arguments["bin"]:
+        print("Function check requires -b/--bin")
+        return False
+    if not os.path.isdir(path):
+        print(f"Error: directory {path} not found")
+        return False
+    return True
+
+
+# runs core dump functions on one parse of the core dump, the output of each function is written to file
+# COREDUMP-FUNCTION.txt in path
+def IOSBatch(coredumpFilename, path, arguments, oIOSCoreDump=None):
+    if not IOSBatchArguments(path, arguments):
+        return
+    functions = [function.strip().lower() for function in arguments["functions"].split(",")]
+    uf.LogLine(f"Parsing {coredumpFilename}")
+    oIOSCoreDump = CoreDump(coredumpFilename, arguments, oIOSCoreDump)
+    if oIOSCoreDump.err is not None:
+        print(oIOSCoreDump.err)
+        return
+    dFunctions = {
+        "regions": IOSRegions,
+        "cwstrings": IOSCWStrings,
+        "heap": IOSHeap,
+        "history": IOSHistory,
+        "events": IOSEvents,
+        "processes": IOSProcesses,
+        "integrity": IOSIntegrityText,
+        "check": lambda coredumpFilename, arguments, oIOSCoreDump: IOSCheckText(
+            coredumpFilename, arguments["bin"], arguments, oIOSCoreDump
+        ),
+    }
+    for function in functions:
+        filename = os.path.join(
+            path, f"{os.path.basename(coredumpFilename)}-{function}.txt"
+        )
+        uf.LogLine(f"Writing {function} to {filename}")
+        try:
+            fOut = open(filename, "w", encoding="utf-8")
+        except OSError:
+            print(f"Error writing {filename}")
+            return
+        with fOut:
+            with contextlib.redirect_stdout(fOut):
+                try:
+                    dFunctions[function](coredumpFilename, arguments, oIOSCoreDump)
+                except KeyboardInterrupt:
+                    raise
+                except:
+                    traceback.print_exc(file=sys.stdout)
+    uf.LogLine("Done")
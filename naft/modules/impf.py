@@ -6,8 +6,15 @@ __original_author__ = "Didier Stevens"
 __current_authors__ = "@digitalsleuth and @G-K7"
 __date__ = "2026/06/29"
 
+import os
+import sys
 import struct
 import re
+import json
+import hashlib
+import bisect
+import collections
+from array import array
 import naft.modules.uf as uf
 
 
@@ -29,19 +36,259 @@ class cCiscoMagic:
     STR_CW_END = STR_CW_ + b"END" + STR_CW_DELIMITER
 
 
+# the value of the interval containing an address, from (start, end, value) intervals that don't overlap; the
+# intervals are sorted by start, and searched with bisect
+class cIntervalIndex:
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = array("q", [interval[0] for interval in intervals])
+        self.ends = array("q", [interval[1] for interval in intervals])
+        self.values = [interval[2] for interval in intervals]
+
+    def __len__(self):
+        return len(self.values)
+
+    def Find(self, address):
+        position = bisect.bisect_right(self.starts, address) - 1
+        if position < 0 or address >= self.ends[position]:
+            return None
+        return self.values[position]
+
+
+# the parsed core dump in an index in ~/.naft/index named after the SHA-256 and size of the core dump, so that copies
+# of a core dump share it: the entries are JSON, with the arrays and bytes in a data file next to it, so that reading an
+# index doesn't run code; the SHA-256 of the core dumps by path are kept in paths.json while their size and modification
+# time are unchanged, to hash a core dump once; entries are written once by Save; an index that can't be read or written
+# is ignored
+class cIOSCoreDumpIndex:
+
+    VERSION = 3
+    DIRECTORY = os.path.join(os.path.expanduser("~"), ".naft", "index")
+    PATHS = "paths.json"
+    TYPECODES = "bBhHiIlLqQfd"
+    oRESHA256 = re.compile("[0-9a-f]{64}")
+
+    def __init__(self, coredumpFilename, directory=None):
+        self.coredumpFilename = os.path.abspath(coredumpFilename)
+        self.directory = self.DIRECTORY if directory is None else directory
+        self.filename = None
+        self.filenameData = None
+        self.key = None
+        self.sha256 = None
+        self.dPaths = {}
+        self.changed = False
+        self.dEntries = {}
+        self.Load()
+
+    def Key(self):
+        oStat = os.stat(self.coredumpFilename)
+        return [oStat.st_size, oStat.st_mtime_ns]
+
+    def Hash(self):
+        oHash = hashlib.sha256()
+        with open(self.coredumpFilename, "rb") as fIn:
+            while True:
+                data = fIn.read(1024 * 1024)
+                if not data:
+                    break
+                oHash.update(data)
+        return oHash.hexdigest()
+
+    # the SHA-256 of the core dump from paths.json, or else hashed
+    def SHA256(self):
+        try:
+            with open(os.path.join(self.directory, self.PATHS), "r", encoding="utf-8") as fJSON:
+                dPaths = json.load(fJSON)
+            if isinstance(dPaths, dict):
+                self.dPaths = dPaths
+        except (OSError, ValueError):
+            pass
+        dPath = self.dPaths.get(self.coredumpFilename)
+        if (
+            isinstance(dPath, dict)
+            and dPath.get("key") == self.key
+            and isinstance(dPath.get("sha256"), str)
+            and self.oRESHA256.fullmatch(dPath["sha256"])
+        ):
+            return dPath["sha256"]
+        return self.Hash()
+
+    def Load(self):
+        try:
+            self.key = self.Key()
+            self.sha256 = self.SHA256()
+            name = os.path.join(self.directory, f"{self.sha256}-{self.key[0]:d}")
+            self.filename = name + ".json"
+            self.filenameData = name + ".data"
+            with open(self.filename, "r", encoding="utf-8") as fJSON:
+                dIndex = json.load(fJSON)
+            if dIndex["version"] != self.VERSION or dIndex["byteorder"] != sys.byteorder:
+                return
+            with open(self.filenameData, "rb") as fData:
+                data = fData.read()
+            if len(data) != dIndex["size"]:
+                return
+            dEntries = self.Decode(dIndex["entries"], data)
+            if not isinstance(dEntries, dict):
+                return
+        except Exception:
+            return
+        self.dEntries = dEntries
+
+    def Get(self, name):
+        return self.dEntries.get(name)
+
+    def Set(self, name, value):
+        self.dEntries[name] = value
+        self.changed = True
+
+    def Save(self):
+        if self.filename is None:
+            return
+        dPath = {"key": self.key, "sha256": self.sha256}
+        try:
+            if self.changed:
+                data = bytearray()
+                entries = self.Encode(self.dEntries, data)
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self.filenameData + ".tmp", "wb") as fData:
+                    fData.write(data)
+                with open(self.filename + ".tmp", "w", encoding="utf-8") as fJSON:
+                    json.dump(
+                        {
+                            "version": self.VERSION,
+                            "byteorder": sys.byteorder,
+                            "size": len(data),
+                            "entries": entries,
+                        },
+                        fJSON,
+                    )
+                os.replace(self.filenameData + ".tmp", self.filenameData)
+                os.replace(self.filename + ".tmp", self.filename)
+            if self.dPaths.get(self.coredumpFilename) != dPath:
+                self.dPaths[self.coredumpFilename] = dPath
+                filenamePaths = os.path.join(self.directory, self.PATHS)
+                os.makedirs(self.directory, exist_ok=True)
+                with open(filenamePaths + ".tmp", "w", encoding="utf-8") as fJSON:
+                    json.dump(self.dPaths, fJSON)
+                os.replace(filenamePaths + ".tmp", filenamePaths)
+        except (OSError, TypeError):
+            self.filename = None
+            return
+        self.changed = False
+
+    # the JSON of a value, lists are lists and the other containers are objects with one key naming their type; the
+    # arrays and bytes are appended to data
+    def Encode(self, value, data):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, list):
+            return [self.Encode(item, data) for item in value]
+        if isinstance(value, tuple):
+            return {"tuple": [self.Encode(item, data) for item in value]}
+        if isinstance(value, collections.Counter):
+            return {"counter": self.EncodeItems(value, data)}
+        if isinstance(value, dict):
+            return {"dict": self.EncodeItems(value, data)}
+        if isinstance(value, array):
+            offset = len(data)
+            data += value.tobytes()
+            return {"array": [value.typecode, offset, len(data) - offset]}
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            offset = len(data)
+            data += value
+            return {"bytes": [offset, len(data) - offset]}
+        if isinstance(value, cIOSProcess):
+            return {"process": self.EncodeItems(vars(value), data)}
+        raise TypeError(f"Unexpected type in index: {type(value).__name__}")
+
+    def EncodeItems(self, dValues, data):
+        return [
+            [self.Encode(key, data), self.Encode(value, data)]
+            for key, value in dValues.items()
+        ]
+
+    def Decode(self, value, data):
+        if isinstance(value, list):
+            return [self.Decode(item, data) for item in value]
+        if not isinstance(value, dict):
+            return value
+        ((name, content),) = value.items()
+        if name == "tuple":
+            return tuple(self.Decode(item, data) for item in content)
+        if name == "counter":
+            return collections.Counter(self.DecodeItems(content, data))
+        if name == "dict":
+            return self.DecodeItems(content, data)
+        if name == "array":
+            typecode, offset, length = content
+            if typecode not in self.TYPECODES:
+                raise ValueError(f"Unexpected array type in index: {typecode}")
+            oArray = array(typecode)
+            oArray.frombytes(self.DecodeBytes(offset, length, data))
+            return oArray
+        if name == "bytes":
+            return self.DecodeBytes(content[0], content[1], data)
+        if name == "process":
+            oIOSProcess = cIOSProcess.__new__(cIOSProcess)
+            for key, item in self.DecodeItems(content, data).items():
+                if not isinstance(key, str):
+                    raise ValueError("Unexpected process field in index")
+                setattr(oIOSProcess, key, item)
+            return oIOSProcess
+        raise ValueError(f"Unexpected type in index: {name}")
+
+    def DecodeItems(self, items, data):
+        return {self.Decode(key, data): self.Decode(value, data) for key, value in items}
+
+    def DecodeBytes(self, offset, length, data):
+        if (
+            not isinstance(offset, int)
+            or not isinstance(length, int)
+            or offset < 0
+            or length < 0
+            or offset + length > len(data)
+        ):
+            raise ValueError("Unexpected bytes in index")
+        return data[offset : offset + length]
+
+
+# the core dump is memory-mapped, regions are memoryview windows on it; the parsed regions, heap and processes are kept
+# for later calls, with index they are taken from and added to the cIOSCoreDumpIndex of the core dump, which Save writes
 class cIOSCoreDump:
 
-    def __init__(self, coredumpFilename):
+    oRENotFF = re.compile(b"[^\xff]")
+
+    def __init__(self, coredumpFilename, index=False):
         self.coredumpFilename = coredumpFilename
+        self.oIndex = cIOSCoreDumpIndex(coredumpFilename) if index else None
+        self.dParsed = {} if self.oIndex is None else self.oIndex.dEntries
+        self.oRegionIndex = None
         self.Parse()
 
+    def Get(self, name):
+        return self.dParsed.get(name)
+
+    def Set(self, name, value):
+        self.dParsed[name] = value
+        if self.oIndex is not None:
+            self.oIndex.Set(name, value)
+
+    def Save(self):
+        if self.oIndex is not None:
+            self.oIndex.Save()
+
     def Parse(self):
         self.err = None
-        self.coredump = uf.File2Data(self.coredumpFilename)
+        self.coredump = uf.File2MappedData(self.coredumpFilename)
         if self.coredump is None:
             self.err = f"Error reading coredump {self.coredumpFilename}"
             return
-        indexRegionsMetaData = self.coredump.find(cCiscoMagic.STR_REGIONS)
+        if self.Get("regions") is not None:
+            self.address, self.size, self.regions = self.Get("regions")
+            return
+        indexRegionsMetaData = uf.FindString(self.coredump, cCiscoMagic.STR_REGIONS)
         if indexRegionsMetaData < 0:
             self.err = (
                 f"Magic sequence {cCiscoMagic.STR_REGIONS.hex().upper()} not found"
@@ -53,14 +300,11 @@ class cIOSCoreDump:
         ):
             self.err = f"Unexpected data found: {self.coredump[indexRegionsMetaData + 4:indexRegionsMetaData + 4 + 4].hex()}"
             return
-        addresses = struct.unpack(
-            ">IIII",
-            self.coredump[
-                indexRegionsMetaData + 20 : indexRegionsMetaData + 20 + 4 * 4
-            ],
+        addresses = struct.unpack_from(
+            ">IIII", self.coredump, indexRegionsMetaData + 20
         )
-        indexHeap = self.coredump.find(
-            cCiscoMagic.STR_BLOCK_BEGIN, addresses[3] - addresses[0]
+        indexHeap = uf.FindString(
+            self.coredump, cCiscoMagic.STR_BLOCK_BEGIN, addresses[3] - addresses[0]
         )
         if indexHeap < 0:
             self.err = (
@@ -96,6 +340,7 @@ class cIOSCoreDump:
                 regionsCalculation[value][1] - addressBegin,
             )
         self.regions = regionsCalculation[:-1]
+        self.Set("regions", (self.address, self.size, self.regions))
 
     def Region(self, name):
         for region in self.regions:
@@ -117,87 +362,115 @@ class cIOSCoreDump:
     def RegionHEAP(self):
         return self.Region("heap")
 
+    # the name of the region containing an address, None outside the regions
+    def FindRegion(self, address):
+        if self.oRegionIndex is None:
+            self.oRegionIndex = cIntervalIndex(
+                [
+                    (region[1], region[1] + region[2], region[0])
+                    for region in self.regions
+                    if region[2] is not None
+                ]
+            )
+        return self.oRegionIndex.Find(address)
+
+    # a new cIOSMemoryParser of the heap region, None without heap region; the heap is walked and the names are
+    # resolved once
+    def HeapParser(self, resolve=False):
+        addressHeap, memoryHeap = self.RegionHEAP()
+        if memoryHeap is None:
+            return None
+        oIOSMemoryParser = cIOSMemoryParser(memoryHeap, self.Get("heap"))
+        if self.Get("heap") is None:
+            self.Set("heap", oIOSMemoryParser.State())
+        if resolve:
+            if self.Get("names") is None:
+                oIOSMemoryParser.ResolveNames(self)
+                self.Set("names", oIOSMemoryParser.dResolvedNames)
+            else:
+                oIOSMemoryParser.dResolvedNames = self.Get("names")
+        return oIOSMemoryParser
+
+    # a new cIOSPointerIndex of the heap of oIOSMemoryParser, the regions are scanned once
+    def PointerIndex(self, oIOSMemoryParser):
+        oIOSPointerIndex = cIOSPointerIndex(self, oIOSMemoryParser, self.Get("pointers"))
+        if self.Get("pointers") is None:
+            self.Set("pointers", oIOSPointerIndex.State())
+        return oIOSPointerIndex
+
+    # the zero-terminated string at address, at most 50 characters
     def GetString(self, address):
         index = address - self.address
         if index < 0 or index >= self.size:
             return None
-        string = ""
-        iterant = 0
-        while (
-            index + iterant < self.size
-            and self.coredump[index + iterant] != 0
-            and iterant < 50
-        ):
-            string += chr(self.coredump[(index + iterant)])
-            iterant += 1
-        return string
+        string = bytes(self.coredump[index : index + 50])
+        end = string.find(0)
+        if end >= 0:
+            string = string[:end]
+        return string.decode("latin-1")
+
+    # the offset of the first 32-bit word from address that is not FFFFFFFF, or of the word after count words that are
+    # FFFFFFFF; words outside the core dump are not FFFFFFFF
+    def FindNotFFFFFFFF(self, address, count):
+        index = address - self.address
+        if index < 0 or index >= self.size:
+            return 0
+        end = index + min(count, (self.size - index) // 4) * 4
+        oMatch = self.oRENotFF.search(self.coredump, index, end)
+        if oMatch is None:
+            return end - index
+        return (oMatch.start() - index) // 4 * 4
 
     def GetInteger32(self, address):
         index = address - self.address
         if index < 0 or index - 4 >= self.size:
             return None
-        return struct.unpack(">I", self.coredump[index : index + 4])[0]
+        return struct.unpack_from(">I", self.coredump, index)[0]
 
 
+# a heap block header, created from its row in a cIOSMemoryBlockTable
 class cIOSMemoryBlockHeader:
 
-    def __init__(self, data, headerSize, index, baseAddress, oIOSMemoryParser):
-        self.data = data
+    def __init__(self, oIOSMemoryParser, row):
+        dColumns = oIOSMemoryParser.Headers.dColumns
         self.err = 0
-        self.headerSize = headerSize
-        if len(data) != 0:
-            if headerSize == 40:
-                header = struct.unpack(">IIIIIIIIII", data[0:headerSize])
-            elif headerSize == 48:
-                header = struct.unpack(">IIIIIIIIIIII", data[0:headerSize])
-            else:
-                self.err = 1
-                return
-            if header[0] != cCiscoMagic.INT_BLOCK_BEGIN:
-                self.err = 2
-                return
-            self.index = index
-            self.address = index + baseAddress
-            self.addressData = self.address + headerSize
-            self.oIOSMemoryParser = oIOSMemoryParser
-            self.PID = header[1]
-            self.AllocCheck = header[2]
-            self.AllocName = header[3]
-            self.AllocNameResolved = ""
-            self.AllocPC = header[4]
-            self.NextBlock = header[5]
-            self.PrevBlock = header[6] - 0x14
-            if self.PrevBlock < baseAddress:
-                self.PrevBlock = 0
-            self.BlockFree, self.BlockSize = self.ParseSizeField(header[7])
-            self.RefCnt = header[8]
-            self.LastFree = header[9]
+        self.row = row
+        self.headerSize = oIOSMemoryParser.headerSize
+        self.index = dColumns["index"][row]
+        self.address = self.index + oIOSMemoryParser.baseAddress
+        self.addressData = self.address + self.headerSize
+        self.oIOSMemoryParser = oIOSMemoryParser
+        self.PID = dColumns["PID"][row]
+        self.AllocCheck = dColumns["AllocCheck"][row]
+        self.AllocName = dColumns["AllocName"][row]
+        self.AllocNameResolved = oIOSMemoryParser.dResolvedNames.get(self.AllocName, "")
+        self.AllocPC = dColumns["AllocPC"][row]
+        self.NextBlock = dColumns["NextBlock"][row]
+        self.PrevBlock = dColumns["PrevBlock"][row]
+        self.BlockFree = dColumns["BlockFree"][row] == 1
+        self.BlockSize = dColumns["BlockSize"][row]
+        self.RefCnt = dColumns["RefCnt"][row]
+        self.LastFree = dColumns["LastFree"][row]
+        if self.BlockFree:
+            self.NextFree = dColumns["NextFree"][row]
+            self.PrevFree = dColumns["PrevFree"][row]
+        else:
             self.NextFree = None
             self.PrevFree = None
-            if self.BlockFree:
-                freeHeader = struct.unpack(
-                    ">IIIIII", data[headerSize : headerSize + 24]
-                )
-                if freeHeader[0] != cCiscoMagic.INT_BLOCK_FREE:
-                    self.err = 3
-                    return
-                if freeHeader[4] >= baseAddress:
-                    self.NextFree = freeHeader[4] - self.headerSize
-                else:
-                    self.NextFree = 0
-                if freeHeader[5] >= baseAddress:
-                    self.PrevFree = freeHeader[5] - self.headerSize - 0x10
-                else:
-                    self.PrevFree = 0
-        else:
-            self.err = 4
-            return
 
-    def ParseSizeField(self, value):
+    @property
+    def data(self):
+        return bytes(
+            self.oIOSMemoryParser.memory[self.index : self.index + self.headerSize + 24]
+        )
+
+    @classmethod
+    def ParseSizeField(cls, value):
         free = value & 0x80000000 == 0x00000000
         size = (value & 0x7FFFFFFF) * 2
         return free, size
 
+    # copies of the block in the memory, which can be a memoryview
     def GetData(self):
         start = self.index + self.headerSize
         if (
@@ -209,13 +482,17 @@ class cIOSMemoryBlockHeader:
             )[0]
             == cCiscoMagic.INT_BLOCK_CANARY
         ):
-            return self.oIOSMemoryParser.memory[start : start + self.BlockSize - 4]
-        return self.oIOSMemoryParser.memory[start : start + self.BlockSize]
+            return bytes(
+                self.oIOSMemoryParser.memory[start : start + self.BlockSize - 4]
+            )
+        return bytes(self.oIOSMemoryParser.memory[start : start + self.BlockSize])
 
     def GetRawData(self):
-        return self.oIOSMemoryParser.memory[
-            self.index : self.index + self.headerSize + self.BlockSize
-        ]
+        return bytes(
+            self.oIOSMemoryParser.memory[
+                self.index : self.index + self.headerSize + self.BlockSize
+            ]
+        )
 
     def ShowLine(self):
         if self.AllocNameResolved == "" or self.AllocNameResolved is None:
@@ -237,18 +514,111 @@ class cIOSMemoryBlockHeader:
     )
 
 
+# the heap block headers as columns of integer arrays with one row per block, in heap walk order; a sequence of
+# cIOSMemoryBlockHeader objects, created when a row is accessed; slices share the columns
+class cIOSMemoryBlockTable:
+
+    COLUMNS = (
+        "index",
+        "PID",
+        "AllocCheck",
+        "AllocName",
+        "AllocPC",
+        "NextBlock",
+        "PrevBlock",
+        "BlockFree",
+        "BlockSize",
+        "RefCnt",
+        "LastFree",
+        "NextFree",
+        "PrevFree",
+    )
+
+    def __init__(self, oIOSMemoryParser, dColumns=None, rows=None):
+        self.oIOSMemoryParser = oIOSMemoryParser
+        if dColumns is None:
+            dColumns = {name: array("q") for name in self.COLUMNS}
+        self.dColumns = dColumns
+        self.rows = rows
+
+    def Rows(self):
+        if self.rows is None:
+            return range(len(self.dColumns["index"]))
+        return self.rows
+
+    def __len__(self):
+        return len(self.Rows())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return cIOSMemoryBlockTable(
+                self.oIOSMemoryParser, self.dColumns, self.Rows()[key]
+            )
+        return cIOSMemoryBlockHeader(self.oIOSMemoryParser, self.Rows()[key])
+
+    def __iter__(self):
+        for row in self.Rows():
+            yield cIOSMemoryBlockHeader(self.oIOSMemoryParser, row)
+
+
+# the cIOSMemoryBlockHeader of the block with data at an address
+class cIOSMemoryBlockAddressIndex:
+
+    def __init__(self, oIOSMemoryBlockTable):
+        self.oIOSMemoryBlockTable = oIOSMemoryBlockTable
+        self.dRows = {}
+
+    def __contains__(self, address):
+        return address in self.dRows
+
+    def __getitem__(self, address):
+        return self.oIOSMemoryBlockTable[self.dRows[address]]
+
+    def __len__(self):
+        return len(self.dRows)
+
+    def __iter__(self):
+        return iter(self.dRows)
+
+
+# with dState, the parser takes the block table from State() of an earlier parse instead of walking the heap
 class cIOSMemoryParser:
 
-    def __init__(self, memory):
+    def __init__(self, memory, dState=None):
         self.memory = memory
         self.length = len(memory)
         self.headerSize = 40
         self.baseAddress = None
-        self.Headers = []
+        self.error = None
+        self.Headers = cIOSMemoryBlockTable(self)
         self.dNames = {}
-        self.dHeadersAddressData = {}
+        self.dHeadersAddressData = cIOSMemoryBlockAddressIndex(self.Headers)
         self.dResolvedNames = {}
-        self.Parse()
+        self.oBlockIndex = None
+        if dState is None:
+            self.Parse()
+        else:
+            self.SetState(dState)
+
+    def State(self):
+        return {
+            "headerSize": self.headerSize,
+            "baseAddress": self.baseAddress,
+            "error": self.error,
+            "dColumns": self.Headers.dColumns,
+            "dRows": self.dHeadersAddressData.dRows,
+            "dNames": self.dNames,
+        }
+
+    def SetState(self, dState):
+        self.headerSize = dState["headerSize"]
+        self.baseAddress = dState["baseAddress"]
+        self.error = dState["error"]
+        self.Headers.dColumns = dState["dColumns"]
+        self.dHeadersAddressData.dRows = dState["dRows"]
+        self.dNames = dState["dNames"]
+        if self.error is not None:
+            print(f"Error {self.error:d}")
 
     def ParseSizeField(self, value):
         free = value & 0x80000000 == 0x80000000
@@ -285,32 +655,95 @@ class cIOSMemoryParser:
         self.baseAddress = header[6] - 0x14
         return True
 
+    # walk the heap from block to block; prints and keeps the error of a block that is not a valid header (2: no block
+    # magic, 3: free block without free magic), the walk ends at a block without next block; the headers and free headers
+    # of the blocks are collected as one big-endian array, and split into the columns of self.Headers afterwards
     def ExtractHeaders(self):
+        oStructHeader = struct.Struct(">" + "I" * (self.headerSize // 4))
+        oStructFreeHeader = struct.Struct(">IIIIII")
+        rowSize = self.headerSize + oStructFreeHeader.size
+        indices = array("q")
+        rows = bytearray()
+        result = False
         index = 0
         while True:
-            oIOSMemoryBlockHeader = cIOSMemoryBlockHeader(
-                self.memory[index : index + self.headerSize + 24],
-                self.headerSize,
-                index,
-                self.baseAddress,
-                self,
-            )
-            if oIOSMemoryBlockHeader.err != 0:
-                if oIOSMemoryBlockHeader.err == 4:
-                    return False
-                print(f"Error {oIOSMemoryBlockHeader.err:d}")
-                return False
-            self.Headers.append(oIOSMemoryBlockHeader)
-            self.dHeadersAddressData[oIOSMemoryBlockHeader.addressData] = (
-                oIOSMemoryBlockHeader
+            data = self.memory[index : index + rowSize]
+            if len(data) == 0:
+                break
+            header = oStructHeader.unpack_from(data)
+            if header[0] != cCiscoMagic.INT_BLOCK_BEGIN:
+                self.error = 2
+                print(f"Error {self.error:d}")
+                break
+            if header[7] & 0x80000000 == 0:
+                if oStructFreeHeader.unpack_from(data, self.headerSize)[0] != cCiscoMagic.INT_BLOCK_FREE:
+                    self.error = 3
+                    print(f"Error {self.error:d}")
+                    break
+            indices.append(index)
+            rows += data
+            rows += bytes(rowSize - len(data))
+            if header[5] == 0:
+                result = True
+                break
+            index = header[5] - self.baseAddress
+        self.SetColumns(indices, rows, result)
+        return result
+
+    def SetColumns(self, indices, rows, last):
+        words = array("I", rows)
+        if sys.byteorder == "little":
+            words.byteswap()
+        stride = len(rows) // len(indices) // 4 if indices else 1
+        freeHeader = self.headerSize // 4
+        baseAddress = self.baseAddress
+        dColumns = self.Headers.dColumns
+        dColumns["index"] = indices
+        for name, word in (
+            ("PID", 1),
+            ("AllocCheck", 2),
+            ("AllocName", 3),
+            ("AllocPC", 4),
+            ("NextBlock", 5),
+            ("RefCnt", 8),
+            ("LastFree", 9),
+        ):
+            dColumns[name] = words[word::stride]
+        dColumns["PrevBlock"] = array(
+            "q",
+            [
+                value - 0x14 if value - 0x14 >= baseAddress else 0
+                for value in words[6::stride]
+            ],
+        )
+        sizes = words[7::stride]
+        dColumns["BlockFree"] = array("q", [value >> 31 ^ 1 for value in sizes])
+        dColumns["BlockSize"] = array("q", [(value & 0x7FFFFFFF) * 2 for value in sizes])
+        # free list links of free blocks, 0 for blocks in use
+        dColumns["NextFree"] = array(
+            "q",
+            [
+                value - self.headerSize if free and value >= baseAddress else 0
+                for free, value in zip(dColumns["BlockFree"], words[freeHeader + 4 :: stride])
+            ],
+        )
+        dColumns["PrevFree"] = array(
+            "q",
+            [
+                value - self.headerSize - 0x10 if free and value >= baseAddress else 0
+                for free, value in zip(dColumns["BlockFree"], words[freeHeader + 5 :: stride])
+            ],
+        )
+        self.dHeadersAddressData.dRows = dict(
+            zip(
+                [index + baseAddress + self.headerSize for index in indices],
+                range(len(indices)),
             )
-            if oIOSMemoryBlockHeader.NextBlock == 0:
-                return True
-            if oIOSMemoryBlockHeader.AllocName in self.dNames:
-                self.dNames[oIOSMemoryBlockHeader.AllocName] += 1
-            else:
-                self.dNames[oIOSMemoryBlockHeader.AllocName] = 1
-            index = oIOSMemoryBlockHeader.NextBlock - self.baseAddress
+        )
+        # the name of the last block is not counted when the walk ended at it
+        self.dNames = dict(
+            collections.Counter(dColumns["AllocName"][:-1] if last else dColumns["AllocName"])
+        )
 
     def Parse(self):
         if not self.InitialChecks():
@@ -318,19 +751,104 @@ class cIOSMemoryParser:
         self.ExtractHeaders()
         return True
 
+    # the cIntervalIndex of the rows of the blocks by index, of the header and data, or of the data only
+    def BlockIndex(self, header=True):
+        dColumns = self.Headers.dColumns
+        return cIntervalIndex(
+            [
+                (
+                    start + (0 if header else self.headerSize),
+                    start + self.headerSize + size,
+                    row,
+                )
+                for row, (start, size) in enumerate(
+                    zip(dColumns["index"], dColumns["BlockSize"])
+                )
+            ]
+        )
+
+    # the cIOSMemoryBlockHeader of the block (header and data) containing an address, None outside the blocks
+    def FindBlock(self, address):
+        if self.oBlockIndex is None:
+            self.oBlockIndex = self.BlockIndex()
+        row = self.oBlockIndex.Find(address - (self.baseAddress or 0))
+        if row is None:
+            return None
+        return self.Headers[row]
+
     def Show(self):
         print(cIOSMemoryBlockHeader.ShowHeader)
         for oIOSMemoryBlockHeader in self.Headers:
             print(oIOSMemoryBlockHeader.ShowLine())
 
+    # the headers look up their resolved name when they are created
     def ResolveNames(self, oIOSCoreDump):
         for address in self.dNames:
             self.dResolvedNames[address] = oIOSCoreDump.GetString(address)
-        for oIOSMemoryBlockHeader in self.Headers:
-            if oIOSMemoryBlockHeader.AllocName in self.dResolvedNames:
-                oIOSMemoryBlockHeader.AllocNameResolved = self.dResolvedNames[
-                    oIOSMemoryBlockHeader.AllocName
-                ]
+
+
+# the addresses of the aligned big-endian 32-bit words in the heap, data and bss regions that point into the data of a
+# heap block: sources holds these addresses sorted by the row of the block they point into, the rows are in targets;
+# the block links in the headers point to headers and are left out
+class cIOSPointerIndex:
+
+    REGIONS = ("heap", "data", "bss")
+
+    def __init__(self, oIOSCoreDump, oIOSMemoryParser, dState=None):
+        self.oIOSMemoryParser = oIOSMemoryParser
+        if dState is None:
+            self.Scan(oIOSCoreDump)
+        else:
+            self.targets = dState["targets"]
+            self.sources = dState["sources"]
+
+    def State(self):
+        return {"targets": self.targets, "sources": self.sources}
+
+    def Scan(self, oIOSCoreDump):
+        baseAddress = self.oIOSMemoryParser.baseAddress
+        oBlockIndex = self.oIOSMemoryParser.BlockIndex(False)
+        pointers = []
+        if len(oBlockIndex) > 0:
+            low = oBlockIndex.starts[0] + baseAddress
+            high = oBlockIndex.ends[-1] + baseAddress
+            # the words with a most significant byte in the range of the heap are candidates
+            oREMostSignificant = re.compile(
+                b"["
+                + re.escape(bytes([low >> 24]))
+                + b"-"
+                + re.escape(bytes([(high - 1) >> 24]))
+                + b"]"
+            )
+            for name in self.REGIONS:
+                address, data = oIOSCoreDump.Region(name)
+                if data is None:
+                    continue
+                skip = -address % 4
+                end = skip + (len(data) - skip) // 4 * 4
+                words = array("I")
+                words.frombytes(data[skip:end])
+                if sys.byteorder == "little":
+                    words.byteswap()
+                address += skip
+                for oMatch in oREMostSignificant.finditer(bytes(data[skip:end:4])):
+                    word = words[oMatch.start()]
+                    if low <= word < high:
+                        pointers.append((word, address + 4 * oMatch.start()))
+        references = []
+        for word, source in pointers:
+            row = oBlockIndex.Find(word - baseAddress)
+            if row is not None:
+                references.append((row, source))
+        references.sort()
+        self.targets = array("q", [row for row, source in references])
+        self.sources = array("q", [source for row, source in references])
+
+    # the addresses pointing into the block of a row, the row of a cIOSMemoryBlockHeader
+    def Sources(self, row):
+        return self.sources[
+            bisect.bisect_left(self.targets, row) : bisect.bisect_right(self.targets, row)
+        ]
 
 
 class cCiscoCWStrings:
@@ -356,13 +874,13 @@ class cCiscoCWStrings:
         if begin[0] >= end[0]:
             self.err = "Error: CW_BEGIN not before CW_END"
             return
-        finalDelimiter = self.data.find(
-            cCiscoMagic.STR_CW_DELIMITER, end[0] + len(cCiscoMagic.STR_CW_END)
+        finalDelimiter = uf.FindString(
+            self.data, cCiscoMagic.STR_CW_DELIMITER, end[0] + len(cCiscoMagic.STR_CW_END)
         )
         if finalDelimiter < 0:
             self.err = "Error: final delimiter $ not found"
             return
-        cwStrings = self.data[begin[0] : finalDelimiter + 1]
+        cwStrings = bytes(self.data[begin[0] : finalDelimiter + 1])
         for index in uf.FindAllStrings(cwStrings, cCiscoMagic.STR_CW_):
             startCWString = cwStrings[index:]
             delimiters = uf.FindAllStrings(startCWString, cCiscoMagic.STR_CW_DELIMITER)
@@ -374,112 +892,256 @@ class cCiscoCWStrings:
             ]
 
 
-class cIOSProcess:
+# the fields of a process structure of a given size, at offsets of 32-bit words; all fields are decoded with one
+# struct.Struct, a field without offset is None
+class cIOSProcessLayout:
 
-    dFields = {
-        664: {
-            "addressProcessName": (">I", 0xC8),
-            "PC": (">I", 0x70),
-            "Q": (">I", 0xCC),
-            "Ty": (">I", 0x64),
-            "Runtime": (">I", 0x9C),
-            "Invoked": (">I", 0x250),
-            "Stack1": (">I", 0x84),
-            "Stack2": (">I", 0x80),
-            "addressStackBlock": (">I", 0x00),
-            "addressTTY": (">I", 0xF0),
-        },
-        692: {
-            "addressProcessName": (">I", 0xD0),
-            "PC": (">I", 0x6C),
-            "Q": (">I", 0xD4),
-            "Ty": (">I", 0x64),
-            "Runtime": (">I", 0xB8),
-            "Invoked": (">I", 0xC8),
-            "Stack1": (">I", 0xEC),
-            "Stack2": (">I", 0xF0),
-            "addressStackBlock": (">I", 0x00),
-            "addressTTY": (">I", 0xF8),
-        },
-        696: {
-            "addressProcessName": (">I", 0xE8),
-            "PC": (">I", 0x90),
-            "Q": (">I", 0xEC),
-            "Ty": (">I", 0x88),
-            "Runtime": (">I", 0xD8),
-            "Invoked": (">I", 0xE0),
-            "Stack1": (">I", 0x100),
-            "Stack2": (">I", 0x104),
-            "addressStackBlock": (">I", 0x00),
-            "addressTTY": (">I", 0xC4),
-        },
-        712: {
-            "addressProcessName": (">I", 0xE8),
-            "PC": (">I", 0x90),
-            "Q": (">I", 0xEC),
-            "Ty": (">I", 0x88),
-            "Runtime": (">I", 0xD0),
-            "Invoked": (">I", 0xE0),
-            "Stack1": (">I", 0x100),
-            "Stack2": (">I", 0x104),
-            "addressStackBlock": (">I", 0x00),
-            "addressTTY": (">I", 0xC4),
-        },
-        732: {
-            "addressProcessName": (">I", 0xF8),
-            "PC": (">I", 0x90),
-            "Q": (">I", 0xFC),
-            "Ty": (">I", 0x88),
-            "Runtime": (">I", 0xE0),
-            "Invoked": (">I", 0xF0),
-            "Stack1": (">I", 0x114),
-            "Stack2": (">I", 0x118),
-            "addressStackBlock": (">I", 0x00),
-            "addressTTY": (">I", 0xCC),
-        },
-        744: {
-            "addressProcessName": (">I", 0xD8),
-            "PC": (">I", 0x70),
-            "Q": (">I", 0xDC),
-            "Ty": (">I", 0x68),
-            "Runtime": (">I", 0xC0),
-            "Invoked": (">I", 0xD0),
-            "Stack1": (">I", 0xF8),
-            "Stack2": (">I", 0xFC),
-            "addressStackBlock": (">I", 0x00),
-            "addressTTY": (">I", 0x100),
-        },
-    }
+    FIELDS = (
+        "addressProcessName",
+        "PC",
+        "Q",
+        "Ty",
+        "Runtime",
+        "Invoked",
+        "Stack1",
+        "Stack2",
+        "addressStackBlock",
+        "addressTTY",
+    )
+
+    def __init__(self, size, dOffsets, byteorder=">"):
+        self.size = size
+        self.dOffsets = {name: dOffsets.get(name) for name in self.FIELDS}
+        offsets = sorted(
+            {offset for offset in self.dOffsets.values() if offset is not None}
+        )
+        structFormat = byteorder
+        position = 0
+        for offset in offsets:
+            if offset > position:
+                structFormat += f"{offset - position:d}x"
+            structFormat += "I"
+            position = offset + 4
+        self.oStruct = struct.Struct(structFormat)
+        self.dIndices = {
+            name: None if offset is None else offsets.index(offset)
+            for name, offset in self.dOffsets.items()
+        }
+
+    def Decode(self, data):
+        values = self.oStruct.unpack_from(data)
+        return {
+            name: None if index is None else values[index]
+            for name, index in self.dIndices.items()
+        }
+
+
+# the process structure layouts by size, from a versioned JSON file, by default data/process_layouts.json; layouts of
+# new IOS versions are added to the file; the layouts of a file are loaded and compiled once
+class cIOSProcessLayouts:
+
+    VERSION = 1
+    FILENAME = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "data",
+        "process_layouts.json",
+    )
+    dLoaded = {}
+
+    @classmethod
+    def Load(cls, filename=None):
+        if filename is None:
+            filename = cls.FILENAME
+        if filename not in cls.dLoaded:
+            with open(filename, "r", encoding="utf-8") as fJSON:
+                dJSON = json.load(fJSON)
+            if dJSON.get("version") != cls.VERSION:
+                raise ValueError(
+                    f"Unsupported process layouts version {dJSON.get('version')} in {filename}"
+                )
+            cls.dLoaded[filename] = cls.Compile(
+                dJSON["layouts"], dJSON.get("byteorder", "big")
+            )
+        return dict(cls.dLoaded[filename])
+
+    # the cIOSProcessLayout objects by size of the layouts of a JSON file, with hexadecimal offsets
+    @classmethod
+    def Compile(cls, dJSONLayouts, byteorder="big"):
+        return {
+            int(size): cIOSProcessLayout(
+                int(size),
+                {
+                    name: None if offset is None else int(offset, 0)
+                    for name, offset in dOffsets.items()
+                },
+                {"big": ">", "little": "<"}[byteorder],
+            )
+            for size, dOffsets in dJSONLayouts.items()
+        }
+
+
+# process structure layouts found with heuristics, stored in a local JSON database by IOS build (CW_FAMILY and
+# CW_VERSION) and structure size, with the layouts of each build as in data/process_layouts.json; dumps of a known build
+# are decoded with the learned layouts, without heuristics; a database that can't be read or written is not used
+class cIOSLearnedProcessLayouts:
+
+    VERSION = 1
+    FILENAME = os.path.join(
+        os.path.expanduser("~"), ".naft", "learned_process_layouts.json"
+    )
+    # a layout is only learned when the heuristics found these fields
+    REQUIRED = ("addressProcessName", "Q", "Ty")
+
+    def __init__(self, filename=None):
+        self.filename = self.FILENAME if filename is None else filename
+        self.usable = True
+        self.dBuilds = {}
+        self.dLayouts = {}
+        try:
+            with open(self.filename, "r", encoding="utf-8") as fJSON:
+                dJSON = json.load(fJSON)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            self.usable = False
+            return
+        try:
+            if dJSON["version"] != self.VERSION or not isinstance(dJSON["builds"], dict):
+                raise ValueError
+            dLayouts = {
+                build: self.Compile(dJSONLayouts)
+                for build, dJSONLayouts in dJSON["builds"].items()
+            }
+        except (KeyError, TypeError, ValueError, AttributeError, struct.error):
+            self.usable = False
+            return
+        self.dBuilds = dJSON["builds"]
+        self.dLayouts = dLayouts
+
+    # cIOSProcessLayouts.Compile, with offsets of words within the structure
+    @classmethod
+    def Compile(cls, dJSONLayouts):
+        dLayouts = cIOSProcessLayouts.Compile(dJSONLayouts)
+        for size, oIOSProcessLayout in dLayouts.items():
+            for offset in oIOSProcessLayout.dOffsets.values():
+                if offset is not None and not 0 <= offset <= size - 4:
+                    raise ValueError(f"Offset {offset:d} outside process structure of size {size:d}")
+        return dLayouts
+
+    # the path, size and modification time of a database
+    @classmethod
+    def Key(cls, filename=None):
+        filename = os.path.abspath(cls.FILENAME if filename is None else filename)
+        try:
+            oStat = os.stat(filename)
+        except OSError:
+            return (filename, None, None)
+        return (filename, oStat.st_size, oStat.st_mtime_ns)
+
+    # the IOS build of the CW_ strings of a core dump, None without CW_FAMILY or CW_VERSION
+    @classmethod
+    def Build(cls, oIOSCoreDump):
+        addressData, memoryData = oIOSCoreDump.RegionDATA()
+        if memoryData is None:
+            return None
+        oCWStrings = cCiscoCWStrings(memoryData)
+        if oCWStrings.err is not None:
+            return None
+        family = oCWStrings.dCWStrings.get(b"CW_FAMILY")
+        version = oCWStrings.dCWStrings.get(b"CW_VERSION")
+        if family is None or version is None:
+            return None
+        return f'{family.decode("latin-1")} {version.decode("latin-1")}'
+
+    def Get(self, build):
+        return dict(self.dLayouts.get(build, {}))
+
+    # returns True when the layout is saved, a layout without the REQUIRED fields is not
+    def Add(self, build, size, dOffsets):
+        if not self.usable:
+            return False
+        if any(dOffsets.get(name) is None for name in self.REQUIRED):
+            return False
+        dJSONLayout = {
+            name: None if offset is None else f"0x{offset:02X}"
+            for name, offset in dOffsets.items()
+        }
+        self.dBuilds.setdefault(build, {})[str(size)] = dJSONLayout
+        self.dLayouts.setdefault(build, {}).update(self.Compile({str(size): dJSONLayout}))
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+            with open(self.filename + ".tmp", "w", encoding="utf-8") as fJSON:
+                json.dump(
+                    {"version": self.VERSION, "byteorder": "big", "builds": self.dBuilds},
+                    fJSON,
+                    indent=4,
+                )
+            os.replace(self.filename + ".tmp", self.filename)
+        except OSError:
+            self.usable = False
+            return False
+        return True
+
+
+# the 32-bit words of the process structures by structure size, as a matrix with one row per process: the rows are
+# kept in flat arrays by number of words, and the statistics of each word offset are computed on the columns
+class cIOSProcessStructures:
+
+    def __init__(self):
+        self.dMatrices = {}
+
+    def Add(self, size, data):
+        words = array("I")
+        words.frombytes(data[: len(data) // 4 * 4])
+        if sys.byteorder == "little":
+            words.byteswap()
+        dMatrix = self.dMatrices.setdefault(size, {})
+        dMatrix.setdefault(len(words), array("I")).extend(words)
+
+    def Column(self, dMatrix, index):
+        column = array("I")
+        for count, rows in dMatrix.items():
+            if index < count:
+                column.extend(rows[index::count])
+        return column
+
+    # the count of each value of each word offset, by structure size
+    def Stats(self):
+        dStats = {}
+        for size, dMatrix in self.dMatrices.items():
+            dStats[size] = {
+                index: dict(collections.Counter(self.Column(dMatrix, index)))
+                for index in range(max(dMatrix, default=0))
+            }
+        return dStats
+
+
+# dLayouts are the cIOSProcessLayout objects by size, by default those of cIOSProcessLayouts; the words of the process
+# structure are added to oIOSProcessStructures
+class cIOSProcess:
 
     def __init__(
         self,
         processID,
         data,
         oIOSCoreDump=None,
-        dProcessStructureStats=None,
-        dHeuristicsFields=None,
+        oIOSProcessStructures=None,
+        dLayouts=None,
     ):
-        if dHeuristicsFields is None:
-            dHeuristicsFields = {}
-        if dProcessStructureStats is None:
-            dProcessStructureStats = {}
-        if dHeuristicsFields != {}:
-            for key, value in dHeuristicsFields.items():
-                self.dFields[key] = value
+        if dLayouts is None:
+            dLayouts = cIOSProcessLayouts.Load()
         self.err = ""
         self.processID = processID
         self.data = data
-        self.indexProcessEnd = self.data.find(
-            cCiscoMagic.STR_PROCESS_END, 600, len(data)
-        )  # BEEFCAFE can appear early in the process as well, parse for one near end of known range
+        self.indexProcessEnd = cIOSProcess.StructureSize(data)
         if self.indexProcessEnd < 0:
             self.err = "Error: parsing process structure, BEEFCAFE not found"
             return
-        if not self.IsSupportedProcessStructure():
+        if not self.IsSupportedProcessStructure(dLayouts):
             self.addressProcessName = None
             self.err = f"Error: unexpected process structure, length = {self.indexProcessEnd:d}"
         else:
-            self.SetFields()
+            self.SetFields(dLayouts[self.indexProcessEnd])
             if self.Q is None:
                 self.Q_str = "?"
             else:
@@ -488,14 +1150,14 @@ class cIOSProcess:
                 self.Ty_str = "?"
             else:
                 self.Ty_str = cIOSProcess.Ty2Str(self.Ty)
-            addressIter = self.addressStackBlock
-            if self.Stack2 is not None:
-                while (
-                    oIOSCoreDump.GetInteger32(addressIter) == 0xFFFFFFFF
-                    and addressIter - self.addressStackBlock <= self.Stack2
-                ):
-                    addressIter += 4
-            self.LowWaterMark = addressIter - self.addressStackBlock
+            # the stack is filled with FFFFFFFF up to the low water mark, a stack of Stack2 bytes is searched up to
+            # the word after it
+            if self.Stack2 is None:
+                self.LowWaterMark = 0
+            else:
+                self.LowWaterMark = oIOSCoreDump.FindNotFFFFFFFF(
+                    self.addressStackBlock, self.Stack2 // 4 + 1
+                )
             if self.addressTTY is None:
                 self.TTY = None
             elif self.addressTTY == 0:
@@ -504,28 +1166,26 @@ class cIOSProcess:
                 self.TTY = None
             else:
                 self.TTY = oIOSCoreDump.GetInteger32(self.addressTTY + 4)
-        if self.indexProcessEnd not in dProcessStructureStats:
-            dProcessStructureStats[self.indexProcessEnd] = {}
-        self.CalcProcessStructureStats(dProcessStructureStats[self.indexProcessEnd])
+        if oIOSProcessStructures is not None:
+            oIOSProcessStructures.Add(self.indexProcessEnd, self.data)
         if oIOSCoreDump is None or self.addressProcessName is None:
             self.name = None
         else:
             self.name = oIOSCoreDump.GetString(self.addressProcessName)
 
-    def IsSupportedProcessStructure(self):
-        return self.indexProcessEnd in cIOSProcess.dFields
+    # the size of the process structure, -1 when BEEFCAFE is not found
+    @classmethod
+    def StructureSize(cls, data):
+        return data.find(
+            cCiscoMagic.STR_PROCESS_END, 600, len(data)
+        )  # BEEFCAFE can appear early in the process as well, parse for one near end of known range
 
-    def SetField(self, fieldName):
-        if self.dFields[self.indexProcessEnd][fieldName] is None:
-            exec(f"self.{fieldName} = None")
-        else:
-            fmt, position = self.dFields[self.indexProcessEnd][fieldName]
-            fieldValue = struct.unpack(fmt, self.data[position : position + 4])[0]
-            exec(f"self.{fieldName} = fieldValue")
+    def IsSupportedProcessStructure(self, dLayouts):
+        return self.indexProcessEnd in dLayouts
 
-    def SetFields(self):
-        for fieldName in self.dFields[self.indexProcessEnd]:
-            self.SetField(fieldName)
+    def SetFields(self, oIOSProcessLayout):
+        for fieldName, fieldValue in oIOSProcessLayout.Decode(self.data).items():
+            setattr(self, fieldName, fieldValue)
 
     @classmethod
     def Q2Str(cls, number):
@@ -554,19 +1214,6 @@ class cIOSProcess:
             return dTys[number]
         return str(number)
 
-    def CalcProcessStructureStats(self, dStats):
-        for index, integer32 in enumerate(
-            struct.unpack(">" + "I" * int(len(self.data) / 4), self.data)
-        ):
-            if index in dStats:
-                bucket = dStats[index]
-                if integer32 in bucket:
-                    bucket[integer32] += 1
-                else:
-                    bucket[integer32] = 1
-            else:
-                dStats[index] = {integer32: 1}
-
     def Line(self):
         line = f"{self.processID:4d} {self.Q_str}{self.Ty_str:<2} "
         line += f"{self.PC:08X} " if self.PC is not None else f"{'?':>8} "
@@ -586,21 +1233,59 @@ class cIOSProcess:
         return line
 
 
+# the processes are analyzed once per cIOSCoreDump, which is parsed for the analysis unless given
 class cIOSCoreDumpAnalysis:
 
-    def __init__(self, coredumpFilename):
+    INDEX_FIELDS = (
+        "processes",
+        "dProcessStructureStats",
+        "RanHeuristics",
+        "HeuristicsSize",
+        "HeuristicsFields",
+        "LearnedBuild",
+        "LearnedFilename",
+        "LayoutDatabaseKey",
+    )
+
+    def __init__(
+        self, coredumpFilename, index=False, oIOSCoreDump=None, layoutDatabase=None
+    ):
+        self.layoutDatabase = layoutDatabase
+        self.LearnedBuild = None
+        self.LearnedFilename = None
         self.err = None
         self.RanHeuristics = False
-        self.oIOSCoreDump = cIOSCoreDump(coredumpFilename)
+        if oIOSCoreDump is None:
+            oIOSCoreDump = cIOSCoreDump(coredumpFilename, index)
+        self.oIOSCoreDump = oIOSCoreDump
         if self.oIOSCoreDump.err is not None:
             self.err = self.oIOSCoreDump.err
             return
-        addressHeap, memoryHeap = self.oIOSCoreDump.RegionHEAP()
-        if memoryHeap is None:
+        # the processes are analyzed again when the database of learned layouts changed
+        dProcesses = self.oIOSCoreDump.Get("processes")
+        if dProcesses is not None and dProcesses.get(
+            "LayoutDatabaseKey"
+        ) == cIOSLearnedProcessLayouts.Key(layoutDatabase):
+            for name, value in dProcesses.items():
+                setattr(self, name, value)
+            return
+        self.Analyze()
+        self.LayoutDatabaseKey = cIOSLearnedProcessLayouts.Key(layoutDatabase)
+        if self.err is None:
+            self.oIOSCoreDump.Set(
+                "processes",
+                {
+                    name: getattr(self, name)
+                    for name in self.INDEX_FIELDS
+                    if hasattr(self, name)
+                },
+            )
+
+    def Analyze(self):
+        oIOSMemoryParser = self.oIOSCoreDump.HeapParser(True)
+        if oIOSMemoryParser is None:
             self.err = "Heap region not found"
             return
-        oIOSMemoryParser = cIOSMemoryParser(memoryHeap)
-        oIOSMemoryParser.ResolveNames(self.oIOSCoreDump)
         dProcessArray = {}
         oLastProcessArray = None
         for oIOSMemoryBlockHeader in oIOSMemoryParser.Headers:
@@ -631,73 +1316,110 @@ class cIOSCoreDumpAnalysis:
                 oIterProcessArray = dProcessArray.get(addressProcessArray)
             else:
                 oIterProcessArray = None
-        self.processes = []
-        self.dProcessStructureStats = {}
+        # the process blocks are read once into a table of process ID, address, data and structure size; the
+        # processes are created when the layouts are known, after the heuristics if needed
+        processTable = []
+        oIOSProcessStructures = cIOSProcessStructures()
+        dLayouts = cIOSProcessLayouts.Load()
+        oLearnedLayouts = cIOSLearnedProcessLayouts(self.layoutDatabase)
+        build = cIOSLearnedProcessLayouts.Build(self.oIOSCoreDump)
+        dLearnedLayouts = {}
+        if build is not None:
+            for size, oIOSProcessLayout in oLearnedLayouts.Get(build).items():
+                if size not in dLayouts:
+                    dLearnedLayouts[size] = oIOSProcessLayout
+        dLayouts.update(dLearnedLayouts)
         countProcessStructureErrors = 0
+        countLearned = 0
+        countLearnedErrors = 0
         for index, addressProcess in enumerate(addressProcesses):
             if addressProcess != 0:
                 if addressProcess in oIOSMemoryParser.dHeadersAddressData:
-                    oIOSProcess = cIOSProcess(
-                        index + 1,
-                        oIOSMemoryParser.dHeadersAddressData[addressProcess].GetData(),
-                        self.oIOSCoreDump,
-                        self.dProcessStructureStats,
-                    )
-                    if oIOSProcess.err.startswith(
-                        "Error: unexpected process structure, length ="
-                    ):
-                        countProcessStructureErrors += 1
-                    self.processes.append((index + 1, addressProcess, oIOSProcess))
+                    data = oIOSMemoryParser.dHeadersAddressData[addressProcess].GetData()
+                    size = cIOSProcess.StructureSize(data)
+                    if size >= 0:
+                        oIOSProcessStructures.Add(size, data)
+                        if size not in dLayouts:
+                            countProcessStructureErrors += 1
+                        elif size in dLearnedLayouts:
+                            countLearned += 1
+                            if not self.IsProcessName(dLearnedLayouts[size], data):
+                                countLearnedErrors += 1
+                    processTable.append((index + 1, addressProcess, data))
                 else:
-                    self.processes.append((index + 1, addressProcess, None))
-        if float(countProcessStructureErrors) / float(len(self.processes)) >= 0.95:
+                    processTable.append((index + 1, addressProcess, None))
+        # learned layouts that don't decode the process names of this dump are not used, as with unknown structures
+        if countLearned > 0:
+            if float(countLearnedErrors) / float(countLearned) >= 0.95:
+                for size in dLearnedLayouts:
+                    del dLayouts[size]
+                countProcessStructureErrors += countLearned
+            else:
+                self.LearnedBuild = build
+                self.LearnedFilename = oLearnedLayouts.filename
+        self.dProcessStructureStats = oIOSProcessStructures.Stats()
+        if float(countProcessStructureErrors) / float(len(processTable)) >= 0.95:
             self.Heuristics()
-            self.processes = []
-            for index, addressProcess in enumerate(addressProcesses):
-                if addressProcess != 0:
-                    if addressProcess in oIOSMemoryParser.dHeadersAddressData:
-                        oIOSProcess = cIOSProcess(
-                            index + 1,
-                            oIOSMemoryParser.dHeadersAddressData[
-                                addressProcess
-                            ].GetData(),
-                            self.oIOSCoreDump,
-                            self.dProcessStructureStats,
-                            {self.HeuristicsSize: self.HeuristicsFields},
-                        )
-                        self.processes.append((index + 1, addressProcess, oIOSProcess))
-                    else:
-                        self.processes.append((index + 1, addressProcess, None))
+            dOffsets = {
+                name: value[1]
+                for name, value in self.HeuristicsFields.items()
+                if value is not None
+            }
+            dLayouts[self.HeuristicsSize] = cIOSProcessLayout(
+                self.HeuristicsSize, dOffsets
+            )
+            if build is not None and oLearnedLayouts.Add(
+                build, self.HeuristicsSize, dOffsets
+            ):
+                self.LearnedBuild = build
+                self.LearnedFilename = oLearnedLayouts.filename
+        self.processes = []
+        for processID, addressProcess, data in processTable:
+            if data is None:
+                self.processes.append((processID, addressProcess, None))
+            else:
+                oIOSProcess = cIOSProcess(
+                    processID, data, self.oIOSCoreDump, None, dLayouts
+                )
+                self.processes.append((processID, addressProcess, oIOSProcess))
 
-    def HeuristicsStructureAnalysis(self):
-        dStats = self.dProcessStructureStats[self.HeuristicsSize]
-        self.dHeuristicsAnalysis = {}
-        for key1 in dStats:
-            countKeys = len(dStats[key1])
-            filtered = [x for x in dStats[key1] if x != 0]
-            if filtered == []:
-                filteredMin = min(dStats[key1])
+    # True when the process name of the process structure data decoded with a layout is a string
+    def IsProcessName(self, oIOSProcessLayout, data):
+        addressProcessName = oIOSProcessLayout.Decode(data)["addressProcessName"]
+        if addressProcessName is None:
+            return False
+        name = self.oIOSCoreDump.GetString(addressProcessName)
+        return bool(name) and name.isprintable()
+
+    # by word offset of the process structures of a size: the count of different values, the minimum, the minimum
+    # without 0, the maximum, the sorted names of the regions of the minimum without 0 and of the maximum, and the
+    # count of each value
+    def StructureAnalysis(self, size):
+        dAnalysis = {}
+        for index, dCounts in self.dProcessStructureStats[size].items():
+            values = sorted(dCounts)
+            minimum = values[0]
+            if minimum == 0 and len(values) > 1:
+                filteredMin = values[1]
             else:
-                filteredMin = min(filtered)
-            unfilteredMax = max(dStats[key1])
-            regionNames = []
-            for region in self.oIOSCoreDump.regions:
-                if region[2] is not None:
-                    if (
-                        region[1] <= filteredMin <= region[1] + region[2] - 1
-                        or region[1] <= unfilteredMax <= region[1] + region[2] - 1
-                    ):
-                        if region[0] not in regionNames:
-                            regionNames.append(region[0])
-            regionNames.sort()
-            self.dHeuristicsAnalysis[key1] = (
-                countKeys,
-                min(dStats[key1]),
+                filteredMin = minimum
+            unfilteredMax = values[-1]
+            regionNames = sorted(
+                {self.oIOSCoreDump.FindRegion(filteredMin), self.oIOSCoreDump.FindRegion(unfilteredMax)}
+                - {None}
+            )
+            dAnalysis[index] = (
+                len(dCounts),
+                minimum,
                 filteredMin,
                 unfilteredMax,
                 regionNames,
-                dStats[key1],
+                dCounts,
             )
+        return dAnalysis
+
+    def HeuristicsStructureAnalysis(self):
+        self.dHeuristicsAnalysis = self.StructureAnalysis(self.HeuristicsSize)
 
     def HeuristicsFindProcessName(self):
         valid = (
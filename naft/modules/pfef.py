@@ -8,41 +8,225 @@ __original_author__ = "Didier Stevens"
 __current_authors__ = "@digitalsleuth and @G-K7"
 __date__ = "2026/06/29"
 
+import os
+import sys
 import struct
 import hashlib
+import heapq
+import ipaddress
 import re
+import tempfile
+from array import array
+
+
+# how a frame was carved, written as provenance to pcapng files
+CARVE_ETHERNET = 0
+CARVE_8021Q = 1
+CARVE_IPV4 = 2
+CARVE_ARP = 3
+CARVE_TYPES = ("Ethernet", "802.1Q", "IPv4", "ARP")
+
+
+# frames already carved, by position (file, index, length) and by content (first 64 bits of the SHA-1 digest);
+# the content digests of exported frames can be saved to and loaded from filename, to skip them in later runs
+class cDedupIndex:
+
+    MAGIC = b"NAFTDDP1"
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.err = None
+        self.dFileIDs = {}
+        self.positions = set()
+        self.digests = set()
+        self.exported = set()
+        if filename is not None:
+            self.Load()
+
+    @classmethod
+    def Digest(cls, data):
+        return int.from_bytes(hashlib.sha1(data).digest()[0:8], "little")
+
+    # False when the frame at this position was already added
+    def AddPosition(self, filename, index, length):
+        if filename not in self.dFileIDs:
+            self.dFileIDs[filename] = len(self.dFileIDs)
+        key = (
+            (self.dFileIDs[filename] << 96)
+            | ((index & 0xFFFFFFFFFFFFFFFF) << 32)
+            | length
+        )
+        if key in self.positions:
+            return False
+        self.positions.add(key)
+        return True
+
+    # False when a frame with the same content was already added
+    def AddDigest(self, digest):
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        return True
+
+    def Load(self):
+        try:
+            f = open(self.filename, "rb")
+        except FileNotFoundError:
+            return
+        except:
+            self.err = f"Error reading {self.filename}"
+            return
+        with f:
+            if f.read(len(self.MAGIC)) != self.MAGIC:
+                self.err = f"{self.filename} is not a naft dedup file"
+                return
+            data = f.read()
+        if len(data) % 8 != 0:
+            self.err = f"{self.filename} is truncated or corrupt"
+            return
+        digests = array("Q", data)
+        if sys.byteorder == "big":
+            digests.byteswap()
+        self.exported = set(digests)
+
+    def Save(self):
+        if self.filename is None or self.err is not None:
+            return False
+        digests = array("Q", sorted(self.exported | self.digests))
+        if sys.byteorder == "big":
+            digests.byteswap()
+        try:
+            f = open(self.filename + ".tmp", "wb")
+        except:
+            return False
+        with f:
+            f.write(self.MAGIC)
+            digests.tofile(f)
+        os.replace(self.filename + ".tmp", self.filename)
+        return True
 
 
 class cFrames:
 
-    def __init__(self, ouiFilename=None):
+    # estimated memory used by one (index, data, filename, carveType) tuple in self.frames, without the data itself
+    FRAME_OVERHEAD = 128
+
+    # with summary, frames are aggregated in a cTrafficSummary instead of stored
+    def __init__(
+        self,
+        ouiFilename=None,
+        memoryBudget=None,
+        dedupFilename=None,
+        filterExpression=None,
+        summary=False,
+    ):
         self.frames = []
         self.countFrames = 0
         self.countPackets = 0
-        self.dHashes = {}
+        self.countStored = 0
+        self.countExported = 0
+        self.countDuplicatePositions = 0
+        self.countDuplicateContents = 0
         self.ParseOUITXT(ouiFilename)
-        self.dFilenameIndexLength = {}
+        self.oDedupIndex = cDedupIndex(dedupFilename)
+        if filterExpression is None:
+            self.oFilter = None
+        else:
+            self.oFilter = cFrameFilter(filterExpression)
+        if summary:
+            self.oSummary = cTrafficSummary()
+        else:
+            self.oSummary = None
+        self.memoryBudget = memoryBudget
+        self.memoryFrames = 0
+        self.runs = []
+        self.runDirectory = None
+        self.filenames = []
+        self.dFilenameIDs = {}
 
-    def AddFramePrivate(self, index, data, duplicates, filename=""):
-        filenameIndexLength = f"{filename}-{index:d}-{len(data):d}"
-        if filenameIndexLength in self.dFilenameIndexLength:
+    def AddFramePrivate(
+        self, index, data, duplicates, filename="", carveType=CARVE_ETHERNET
+    ):
+        if self.oSummary is not None:
+            if not self.oSummary.AddPosition(filename, index, len(data)):
+                self.countDuplicatePositions += 1
+                return False
+            self.oSummary.AddFrame(data, carveType)
+            self.countStored += 1
+            return True
+        if not self.oDedupIndex.AddPosition(filename, index, len(data)):
+            self.countDuplicatePositions += 1
             return False
-        self.dFilenameIndexLength[filenameIndexLength] = True
-        sha1Hash = hashlib.sha1(data).hexdigest()
-        if sha1Hash not in self.dHashes:
-            self.dHashes[sha1Hash] = 0
-        self.dHashes[sha1Hash] += 1
-        if duplicates or self.dHashes[sha1Hash] == 1:
-            self.frames.append((index, data))
+        digest = cDedupIndex.Digest(data)
+        # exported frames are counted once, however often they are carved
+        if digest in self.oDedupIndex.exported:
+            if self.oDedupIndex.AddDigest(digest):
+                self.countExported += 1
+            return True
+        first = self.oDedupIndex.AddDigest(digest)
+        if not first:
+            self.countDuplicateContents += 1
+        if first or duplicates:
+            self.frames.append((index, bytes(data), filename, carveType))
+            self.countStored += 1
+            if self.memoryBudget is not None:
+                self.memoryFrames += len(data) + self.FRAME_OVERHEAD
+                if self.memoryFrames >= self.memoryBudget:
+                    self.SpillFrames()
         return True
 
-    def AddFrame(self, index, data, duplicates, filename=""):
-        if (
-            not self.dOUI
-            or data[0:3].hex() in self.dOUI
-            or data[6:9].hex() in self.dOUI
-        ):
-            if self.AddFramePrivate(index, data, duplicates, filename):
+    # write the frames in memory as a run sorted by index to a temporary file in runDirectory
+    def SpillFrames(self):
+        if not self.frames:
+            return
+        fd, filenameRun = tempfile.mkstemp(prefix="naft-frames-", dir=self.runDirectory)
+        with os.fdopen(fd, "wb") as fRun:
+            for index, data, filename, carveType in sorted(
+                self.frames, key=lambda x: x[0]
+            ):
+                if filename not in self.dFilenameIDs:
+                    self.dFilenameIDs[filename] = len(self.filenames)
+                    self.filenames.append(filename)
+                fRun.write(
+                    struct.pack(
+                        "<qIIB", index, len(data), self.dFilenameIDs[filename], carveType
+                    )
+                )
+                fRun.write(data)
+        self.runs.append(filenameRun)
+        self.frames = []
+        self.memoryFrames = 0
+
+    def ReadRun(self, filenameRun):
+        with open(filenameRun, "rb") as fRun:
+            while True:
+                header = fRun.read(17)
+                if len(header) < 17:
+                    break
+                index, length, filenameID, carveType = struct.unpack("<qIIB", header)
+                yield index, fRun.read(length), self.filenames[filenameID], carveType
+
+    # all frames sorted by index: a k-way merge of the spilled runs and the frames still in memory;
+    # the merge is stable, frames with the same index stay in the order they were added; the spilled runs are kept
+    # until RemoveRuns, a checkpoint refers to them
+    def SortedFrames(self):
+        if not self.runs:
+            return sorted(self.frames, key=lambda x: x[0])
+        runs = [self.ReadRun(filenameRun) for filenameRun in self.runs]
+        runs.append(sorted(self.frames, key=lambda x: x[0]))
+        return heapq.merge(*runs, key=lambda x: x[0])
+
+    def RemoveRuns(self):
+        for filenameRun in self.runs:
+            try:
+                os.remove(filenameRun)
+            except OSError:
+                pass
+        self.runs = []
+
+    def AddFrame(self, index, data, duplicates, filename="", carveType=CARVE_ETHERNET):
+        if not self.ouiPrefixes or MatchOUI(data, 0, self.ouiPrefixes):
+            if self.AddFramePrivate(index, data, duplicates, filename, carveType):
                 self.countFrames += 1
 
     def AddIPPacket(self, index, data, duplicates, filename=""):
@@ -54,9 +238,22 @@ class cFrames:
             + data,
             duplicates,
             filename,
+            CARVE_IPV4,
         ):
             self.countPackets += 1
 
+    # the buffer carved next ends at end and overlaps the buffer after it by overlap bytes
+    def Window(self, end, overlap):
+        if self.oSummary is not None:
+            self.oSummary.Window(end, overlap)
+
+    def AddCarved(self, carved, duplicates, filename=""):
+        for carveType, index, data in carved:
+            if carveType == CARVE_IPV4:
+                self.AddIPPacket(index, data, duplicates, filename)
+            else:
+                self.AddFrame(index, data, duplicates, filename, carveType)
+
     def WritePCAP(self, filename):
         try:
             f = open(filename, "wb")
@@ -71,7 +268,7 @@ class cFrames:
             f.write(b"\x00\x00\x00\x00")  # accuracy of timestamps
             f.write(b"\xff\xff\x00\x00")  # max length of captured packets, in octets
             f.write(b"\x01\x00\x00\x00")  # data link type
-            for frame in sorted(self.frames, key=lambda x: x[0]):
+            for frame in self.SortedFrames():
                 # Packet Header
                 f.write(
                     struct.pack("<I", int(frame[0] / 1000000))
@@ -89,8 +286,68 @@ class cFrames:
                 f.write(frame[1][0:0xFFFF])
         return True
 
+    # pcapng blocks: type, total length, body padded to 32 bits, total length
+    @classmethod
+    def PCAPNGBlock(cls, blockType, body):
+        body += b"\x00" * (-len(body) % 4)
+        return (
+            struct.pack("<II", blockType, len(body) + 12)
+            + body
+            + struct.pack("<I", len(body) + 12)
+        )
+
+    @classmethod
+    def PCAPNGOption(cls, code, value):
+        return struct.pack("<HH", code, len(value)) + value + b"\x00" * (-len(value) % 4)
+
+    # pcapng with the source file, offset and carve type of each frame as comment; blocks are written while
+    # the sorted frames are merged, the timestamps are set to the address as in WritePCAP
+    def WritePCAPNG(self, filename):
+        try:
+            f = open(filename, "wb")
+        except:
+            return False
+        with f:
+            f.write(
+                self.PCAPNGBlock(
+                    0x0A0D0D0A,  # Section Header Block
+                    struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1)
+                    + self.PCAPNGOption(4, b"naft")  # shb_userappl
+                    + self.PCAPNGOption(0, b""),  # opt_endofopt
+                )
+            )
+            f.write(
+                self.PCAPNGBlock(
+                    0x00000001,  # Interface Description Block
+                    struct.pack("<HHI", 1, 0, 0xFFFF),  # Ethernet, snaplen
+                )
+            )
+            for index, data, filenameFrame, carveType in self.SortedFrames():
+                timestamp = int(index / 1000000) * 1000000 + int(index % 1000000)
+                comment = f"file: {filenameFrame} offset: 0x{index:x} ({index:d}) type: {CARVE_TYPES[carveType]}"
+                f.write(
+                    self.PCAPNGBlock(
+                        0x00000006,  # Enhanced Packet Block
+                        struct.pack(
+                            "<IIIII",
+                            0,
+                            (timestamp >> 32) & 0xFFFFFFFF,
+                            timestamp & 0xFFFFFFFF,
+                            min(len(data), 0xFFFF),
+                            min(len(data), 0xFFFF),
+                        )
+                        + data[0:0xFFFF]
+                        + b"\x00" * (-min(len(data), 0xFFFF) % 4)
+                        + self.PCAPNGOption(1, comment.encode("utf-8"))  # opt_comment
+                        + self.PCAPNGOption(0, b""),
+                    )
+                )
+        return True
+
+    # a file that can't be read leaves the OUI filter off, as without file
     def ParseOUITXT(self, ouiFilename):
         self.dOUI = {}
+        self.ouiPrefixes = frozenset()
         if ouiFilename is not None:
             oRe = re.compile("^([0-9a-f]{6})")
             try:
@@ -102,6 +359,332 @@ class cFrames:
                     oMatch = oRe.search(line.lower())
                     if oMatch:
                         self.dOUI[oMatch.group(1)] = line.strip("\n")
+        self.ouiPrefixes = frozenset(int(oui, 16) for oui in self.dOUI)
+
+
+# records carved frames and packets instead of storing them, e.g. in a worker process;
+# cFrames.AddCarved adds them afterwards in the same order, with the same deduplication as direct carving
+class cCarvedFrames:
+
+    def __init__(self, ouiPrefixes=frozenset(), oFilter=None):
+        self.carved = []
+        self.ouiPrefixes = ouiPrefixes
+        self.oFilter = oFilter
+
+    def AddFrame(self, index, data, duplicates, filename="", carveType=CARVE_ETHERNET):
+        self.carved.append((carveType, index, bytes(data)))
+
+    def AddIPPacket(self, index, data, duplicates, filename=""):
+        self.carved.append((CARVE_IPV4, index, bytes(data)))
+
+
+# counts of the most frequent keys, in at most 2 * capacity entries: when full, only the capacity keys with the highest
+# counts are kept, and the counts of keys pruned before are lower bounds
+class cTopCounter:
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.dCounts = {}
+        self.pruned = False
+
+    def Add(self, key, count=1):
+        self.dCounts[key] = self.dCounts.get(key, 0) + count
+        if len(self.dCounts) >= 2 * self.capacity:
+            self.dCounts = dict(self.Top(self.capacity))
+            self.pruned = True
+
+    def Top(self, count):
+        return heapq.nlargest(count, self.dCounts.items(), key=lambda x: x[1])
+
+
+# traffic statistics of carved frames in fixed-size state: frames per carve type, histograms of IP protocols, TCP and
+# UDP ports and VLAN IDs, and the IP addresses with the most bytes and the ARP IP-to-MAC bindings in cTopCounters;
+# frames are only deduplicated by position in the overlap of buffers, copies of a frame are counted
+class cTrafficSummary:
+
+    CAPACITY = 1000
+
+    def __init__(self):
+        self.frames = array("Q", bytes(8 * len(CARVE_TYPES)))
+        self.bytes = 0
+        self.protocols = array("Q", bytes(8 * 0x100))
+        self.dPorts = {
+            6: array("Q", bytes(8 * 0x10000)),
+            17: array("Q", bytes(8 * 0x10000)),
+        }
+        self.vlans = array("Q", bytes(8 * 0x1000))
+        self.oTalkers = cTopCounter(self.CAPACITY)
+        self.oBindings = cTopCounter(self.CAPACITY)
+        self.positions = set()
+        self.positionsPrevious = set()
+        self.overlapStart = None
+
+    # the buffer being carved ends at end and overlaps the next buffer by overlap bytes; only the positions of the
+    # frames reaching into the overlap are kept, to skip these frames when they are carved again from the next buffer
+    def Window(self, end, overlap):
+        self.positionsPrevious = self.positions
+        self.positions = set()
+        self.overlapStart = end - overlap
+
+    # False for a frame at the same position in the overlap with the previous buffer
+    def AddPosition(self, filename, index, length):
+        position = (filename, index, length)
+        if position in self.positionsPrevious:
+            return False
+        if self.overlapStart is not None and index + length > self.overlapStart:
+            self.positions.add(position)
+        return True
+
+    # data is the Ethernet frame as cFrames stores it
+    def AddFrame(self, data, carveType):
+        self.frames[carveType] += 1
+        self.bytes += len(data)
+        try:
+            if carveType == CARVE_ARP:
+                self.AddARP(data)
+                return
+            fields = IPHeaderFields(data, 18 if carveType == CARVE_8021Q else 14)
+        except IndexError:
+            return
+        if carveType == CARVE_8021Q:
+            self.vlans[fields[cFrameFilter.VLAN]] += 1
+        self.protocols[fields[cFrameFilter.PROTOCOL]] += 1
+        ports = self.dPorts.get(fields[cFrameFilter.PROTOCOL])
+        if ports is not None and fields[cFrameFilter.SOURCE_PORT] is not None:
+            ports[fields[cFrameFilter.SOURCE_PORT]] += 1
+            ports[fields[cFrameFilter.DESTINATION_PORT]] += 1
+        self.oTalkers.Add(fields[cFrameFilter.SOURCE], len(data))
+        self.oTalkers.Add(fields[cFrameFilter.DESTINATION], len(data))
+
+    # the sender binding of requests and replies, and the target binding of replies
+    def AddARP(self, data):
+        if data[20] == 0 and data[21] == 2:
+            self.AddBinding(data[38:42], data[32:38])
+        self.AddBinding(data[28:32], data[22:28])
+
+    def AddBinding(self, address, mac):
+        if len(address) == 4 and len(mac) == 6 and any(address) and any(mac):
+            self.oBindings.Add((int.from_bytes(address, "big"), bytes(mac)))
+
+    # the non-zero counts by value, the top highest in descending order
+    @classmethod
+    def Histogram(cls, counts, top=None):
+        histogram = [(value, count) for value, count in enumerate(counts) if count > 0]
+        if top is not None:
+            histogram = heapq.nlargest(top, histogram, key=lambda x: x[1])
+        return dict(histogram)
+
+    def Summary(self, top=20):
+        dMACs = {}
+        for (address, mac), count in self.oBindings.dCounts.items():
+            dMACs.setdefault(address, []).append(mac)
+        return {
+            "frames": dict(zip(CARVE_TYPES, self.frames)),
+            "bytes": self.bytes,
+            "protocols": self.Histogram(self.protocols),
+            "ports": {
+                "tcp": self.Histogram(self.dPorts[6], top),
+                "udp": self.Histogram(self.dPorts[17], top),
+            },
+            "vlans": self.Histogram(self.vlans),
+            "talkers": {
+                str(ipaddress.IPv4Address(address)): count
+                for address, count in self.oTalkers.Top(top)
+            },
+            "arpBindings": [
+                {
+                    "address": str(ipaddress.IPv4Address(address)),
+                    "mac": mac.hex(":"),
+                    "frames": count,
+                }
+                for (address, mac), count in self.oBindings.Top(self.CAPACITY)
+            ],
+            "arpConflicts": {
+                str(ipaddress.IPv4Address(address)): [mac.hex(":") for mac in macs]
+                for address, macs in sorted(dMACs.items())
+                if len(macs) > 1
+            },
+            "pruned": {
+                "talkers": self.oTalkers.pruned,
+                "arpBindings": self.oBindings.pruned,
+            },
+        }
+
+
+# filter of carved frames, with a subset of the pcap-filter syntax: ip, arp, ether proto N, vlan [ID], tcp, udp, icmp,
+# [ip] proto N|NAME, [src|dst] host ADDRESS, [src|dst] net CIDR and [src|dst] port N, combined with and/&&, or/||,
+# not/! and parentheses; frames are matched on the fields a signature extracts from a hit, before the frame is stored
+class cFrameFilter:
+
+    # fields of a hit
+    ETHERTYPE = 0
+    VLAN = 1
+    PROTOCOL = 2
+    SOURCE = 3
+    DESTINATION = 4
+    SOURCE_PORT = 5
+    DESTINATION_PORT = 6
+
+    ETHERTYPES = {"ip": 0x0800, "arp": 0x0806}
+    PROTOCOLS = {
+        "icmp": 1,
+        "igmp": 2,
+        "tcp": 6,
+        "udp": 17,
+        "gre": 47,
+        "esp": 50,
+        "ah": 51,
+        "ospf": 89,
+        "sctp": 132,
+    }
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.err = None
+        self.tree = None
+        self.tokens = re.findall(r"\(|\)|&&|\|\||!|[^\s()!&|]+", expression)
+        self.position = 0
+        try:
+            self.tree = self.ParseOr()
+            if self.Peek() is not None:
+                raise ValueError(f"unexpected {self.Peek()}")
+        except ValueError as e:
+            self.err = f"Error in filter expression {expression}: {e}"
+        self.tokens = None
+
+    def Peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def Next(self):
+        token = self.Peek()
+        if token is None:
+            raise ValueError("unexpected end")
+        self.position += 1
+        return token
+
+    @classmethod
+    def ParseNumber(cls, token, maximum, dNames={}):
+        if token in dNames:
+            return dNames[token]
+        try:
+            number = int(token, 0)
+        except ValueError:
+            raise ValueError(f"invalid number {token}")
+        if not 0 <= number <= maximum:
+            raise ValueError(f"{token} out of range")
+        return number
+
+    # network address and mask as integers
+    @classmethod
+    def ParseNetwork(cls, token):
+        try:
+            oNetwork = ipaddress.IPv4Network(token, strict=False)
+        except ValueError:
+            raise ValueError(f"invalid address {token}")
+        return int(oNetwork.network_address), int(oNetwork.netmask)
+
+    # the node for a src or dst qualifier, either without one
+    @classmethod
+    def Directed(cls, direction, operator, source, destination, *values):
+        if direction == "src":
+            return (operator, source, *values)
+        if direction == "dst":
+            return (operator, destination, *values)
+        return ("or", (operator, source, *values), (operator, destination, *values))
+
+    def ParseOr(self):
+        node = self.ParseAnd()
+        while self.Peek() in ("or", "||"):
+            self.Next()
+            node = ("or", node, self.ParseAnd())
+        return node
+
+    def ParseAnd(self):
+        node = self.ParsePrimitive()
+        while self.Peek() in ("and", "&&"):
+            self.Next()
+            node = ("and", node, self.ParsePrimitive())
+        return node
+
+    def ParsePrimitive(self):
+        token = self.Next()
+        if token in ("not", "!"):
+            return ("not", self.ParsePrimitive())
+        if token == "(":
+            node = self.ParseOr()
+            if self.Next() != ")":
+                raise ValueError("missing )")
+            return node
+        direction = None
+        if token in ("src", "dst"):
+            direction = token
+            token = self.Next()
+        if token in ("host", "net"):
+            return self.Directed(
+                direction, "net", self.SOURCE, self.DESTINATION, *self.ParseNetwork(self.Next())
+            )
+        if token == "port":
+            return self.Directed(
+                direction,
+                "eq",
+                self.SOURCE_PORT,
+                self.DESTINATION_PORT,
+                self.ParseNumber(self.Next(), 0xFFFF),
+            )
+        if direction is not None:
+            raise ValueError(f"expected host, net or port after {direction}")
+        if token == "ip" and self.Peek() == "proto":
+            token = self.Next()
+        if token in self.ETHERTYPES:
+            return ("eq", self.ETHERTYPE, self.ETHERTYPES[token])
+        if token in self.PROTOCOLS:
+            return ("eq", self.PROTOCOL, self.PROTOCOLS[token])
+        if token == "proto":
+            return ("eq", self.PROTOCOL, self.ParseNumber(self.Next(), 0xFF, self.PROTOCOLS))
+        if token == "ether":
+            if self.Next() != "proto":
+                raise ValueError("expected proto after ether")
+            return ("eq", self.ETHERTYPE, self.ParseNumber(self.Next(), 0xFFFF, self.ETHERTYPES))
+        if token == "vlan":
+            if self.Peek() is not None and self.Peek()[0].isdigit():
+                return ("eq", self.VLAN, self.ParseNumber(self.Next(), 0xFFF))
+            return ("present", self.VLAN)
+        raise ValueError(f"unknown {token}")
+
+    def Evaluate(self, node, fields):
+        operator = node[0]
+        if operator == "and":
+            return self.Evaluate(node[1], fields) and self.Evaluate(node[2], fields)
+        if operator == "or":
+            return self.Evaluate(node[1], fields) or self.Evaluate(node[2], fields)
+        if operator == "not":
+            return not self.Evaluate(node[1], fields)
+        if operator == "eq":
+            return fields[node[1]] == node[2]
+        if operator == "net":
+            return fields[node[1]] is not None and fields[node[1]] & node[3] == node[2]
+        return fields[node[1]] is not None
+
+    # the hits at indices whose fields match, hits too short for their fields are dropped
+    def Filter(self, data, indices, fields):
+        filtered = []
+        for index in indices:
+            try:
+                if self.Evaluate(self.tree, fields(data, index)):
+                    filtered.append(index)
+            except IndexError:
+                pass
+        return filtered
+
+
+# True when the destination or source MAC address of the Ethernet frame starting at index has an OUI in ouiPrefixes
+def MatchOUI(data, index, ouiPrefixes):
+    return len(data) >= index + 9 and (
+        int.from_bytes(data[index : index + 3], "big") in ouiPrefixes
+        or int.from_bytes(data[index + 6 : index + 9], "big") in ouiPrefixes
+    )
 
 
 # http://stackoverflow.com/questions/3949726/calculate-ip-checksum-in-python
@@ -117,82 +700,251 @@ def CalculateIPChecksum(data):
     return ~s & 0xFFFF
 
 
+IPV4_HEADER_START = b"\x45"
+IPV4_OPTIONS_HEADER_START = b"[\x45-\x4f]"
+ARP_ETHERNET_START = b"\x08\x06\x00\x01\x08\x00\x06\x04"  # https://en.wikipedia.org/wiki/Address_Resolution_Protocol
+
+
+def FindSignature(data, pattern):
+    return list(map(re.Match.start, re.finditer(pattern, data)))
+
+
+# one pass over the data for all version/IHL bytes
+def FindIPHeaderCandidates(data, options):
+    if options:
+        return FindSignature(data, IPV4_OPTIONS_HEADER_START)
+    return FindSignature(data, IPV4_HEADER_START)
+
+
+# checksum all candidates in bulk: the one's complement sum of the 16-bit words of a valid IPv4 header is 0xFFFF,
+# and as 2**16 == 1 (mod 0xFFFF) this holds when the header read as one big integer is a multiple of 0xFFFF
+# (never 0, the first byte is at least 0x45); headers truncated to an odd length at the end of the data are invalid;
+# valid headers are returned sorted as one data.find loop per version/IHL byte would return them
+def CheckIPHeaders(data, indices):
+    size = len(data)
+    indices = sorted(indices, key=data.__getitem__)
+    return [
+        index
+        for index in indices
+        if int.from_bytes(data[index : index + 4 * (data[index] - 0x40)], "big")
+        % 0xFFFF
+        == 0
+        and (index + 4 * (data[index] - 0x40) <= size or (size - index) % 2 == 0)
+    ]
+
+
+# with an OUI filter, candidates inside an Ethernet frame without a matching MAC address are dropped before their
+# checksum is calculated; packets without an Ethernet header are not filtered by OUI
+def FilterIPHeadersOUI(data, indices, ouiPrefixes):
+    filtered = []
+    for index in indices:
+        if index >= 18 and data[index - 2] == 8 and data[index - 1] == 0:
+            if data[index - 6] == 0x81 and data[index - 5] == 0:
+                start = index - 2 * 6 - 4 - 2
+            else:
+                start = index - 2 * 6 - 2
+            if not MatchOUI(data, start, ouiPrefixes):
+                continue
+        filtered.append(index)
+    return filtered
+
+
+def FindIPHeaders(data, options):
+    return CheckIPHeaders(data, FindIPHeaderCandidates(data, options))
+
+
+# the cFrameFilter fields of the valid IPv4 header at index, classified as AddIPHeader does; ports of TCP, UDP and
+# SCTP are only in the first fragment
+def IPHeaderFields(data, index):
+    vlan = None
+    if data[index - 2] == 8 and data[index - 1] == 0:
+        if data[index - 6] == 0x81 and data[index - 5] == 0:
+            vlan = (data[index - 4] & 0x0F) * 0x100 + data[index - 3]
+    protocol = data[index + 9]
+    sourcePort = None
+    destinationPort = None
+    headerEnd = index + 4 * (data[index] - 0x40)
+    if (
+        protocol in (6, 17, 132)
+        and data[index + 6] & 0x1F == 0
+        and data[index + 7] == 0
+        and len(data) >= headerEnd + 4
+    ):
+        sourcePort = data[headerEnd] * 0x100 + data[headerEnd + 1]
+        destinationPort = data[headerEnd + 2] * 0x100 + data[headerEnd + 3]
+    return (
+        0x0800,
+        vlan,
+        protocol,
+        int.from_bytes(data[index + 12 : index + 16], "big"),
+        int.from_bytes(data[index + 16 : index + 20], "big"),
+        sourcePort,
+        destinationPort,
+    )
+
+
+def AddIPHeader(oFrames, baseAddress, data, index, duplicates, filename=""):
+    packetLength = data[index + 2] * 0x100 + data[index + 3]
+    if data[index - 2] == 8 and data[index - 1] == 0:  # EtherType IP
+        # IPv4 packet is inside an Ethernet frame; store the Ethernet frame
+        if data[index - 6] == 0x81 and data[index - 5] == 0:
+            # 802.1Q, assuming no double tagging
+            oFrames.AddFrame(
+                baseAddress + index - 2 * 6 - 4 - 2,
+                data[index - 2 * 6 - 4 - 2 : index + packetLength],
+                duplicates,
+                filename,
+                CARVE_8021Q,
+            )
+        else:
+            oFrames.AddFrame(
+                baseAddress + index - 2 * 6 - 2,
+                data[index - 2 * 6 - 2 : index + packetLength],
+                duplicates,
+                filename,
+            )
+    else:
+        # IPv4 packet is not inside an Ethernet frame; store the IPv4 packet
+        oFrames.AddIPPacket(
+            baseAddress + index,
+            data[index : index + packetLength],
+            duplicates,
+            filename,
+        )
+
+
 # search for bytes between 0x45 and 0x4F (depending flag options) and check if they are the start of an IPv4 header by calculating and comparing the checksum
 def ExtractIPPackets(
     oFrames, baseAddress, data, options, duplicates, multiple, filename=""
 ):
     found = False
-    if options:
-        maxHeader = 0x50
-    else:
-        maxHeader = 0x46
-    for headerStart in range(0x45, maxHeader):
-        index = 0
-        while index != -1:
-            index = data.find(headerStart, index)
-            if index != -1:
-                try:
-                    potentialIPHeader = data[index : index + 4 * (data[index] - 0x40)]
-                    if CalculateIPChecksum(potentialIPHeader) == 0:
-                        packetLength = (
-                            potentialIPHeader[2] * 0x100 + potentialIPHeader[3]
-                        )
-                        if (
-                            data[index - 2] == 8 and data[index - 1] == 0
-                        ):  # EtherType IP
-                            # IPv4 packet is inside an Ethernet frame; store the Ethernet frame
-                            if (
-                                data[index - 6] == 0x81 and data[index - 5] == 0
-                            ):  # 802.1Q, assuming no double tagging
-                                oFrames.AddFrame(
-                                    baseAddress + index - 2 * 6 - 4 - 2,
-                                    data[index - 2 * 6 - 4 - 2 : index + packetLength],
-                                    duplicates,
-                                    filename,
-                                )
-                                found = True
-                            else:
-                                oFrames.AddFrame(
-                                    baseAddress + index - 2 * 6 - 2,
-                                    data[index - 2 * 6 - 2 : index + packetLength],
-                                    duplicates,
-                                    filename,
-                                )
-                                found = True
-                        else:
-                            # IPv4 packet is not inside an Ethernet frame; store the IPv4 packet
-                            oFrames.AddIPPacket(
-                                baseAddress + index,
-                                data[index : index + packetLength],
-                                duplicates,
-                                filename,
-                            )
-                            found = True
-                except:
-                    pass
-                index += 1
-            if found and not multiple:
-                return found
+    for index in FindIPHeaders(data, options):
+        try:
+            AddIPHeader(oFrames, baseAddress, data, index, duplicates, filename)
+            found = True
+        except:
+            pass
+        if found and not multiple:
+            return found
     return found
 
 
+def AddARPFrame(oFrames, baseAddress, data, index, duplicates, filename=""):
+    oFrames.AddFrame(
+        baseAddress + index - 2 * 6,
+        data[index - 2 * 6 : index + 30],
+        duplicates,
+        filename,
+        CARVE_ARP,
+    )
+
+
+# the cFrameFilter fields of the ARP frame at index: the sender and target protocol address are source and destination
+def ARPFrameFields(data, index):
+    return (
+        0x0806,
+        None,
+        None,
+        int.from_bytes(data[index + 16 : index + 20], "big"),
+        int.from_bytes(data[index + 26 : index + 30], "big"),
+        None,
+        None,
+    )
+
+
+def FilterARPFramesOUI(data, indices, ouiPrefixes):
+    return [
+        index
+        for index in indices
+        if index < 2 * 6 or MatchOUI(data, index - 2 * 6, ouiPrefixes)
+    ]
+
+
 # search for ARP frames for Ethernet, they start with \x08\x06\x00\x01\x08\x00\x06\x04
 def ExtractARPFrames(oFrames, baseAddress, data, duplicates, multiple, filename=""):
     found = False
-    index = 0
-    while index != -1:
-        index = data.find(
-            b"\x08\x06\x00\x01\x08\x00\x06\x04", index
-        )  # https://en.wikipedia.org/wiki/Address_Resolution_Protocol
-        if index != -1:
-            oFrames.AddFrame(
-                baseAddress + index - 2 * 6,
-                data[index - 2 * 6 : index + 30],
-                duplicates,
-                filename,
-            )
-            found = True
-            index += 1
-        if found and not multiple:
+    for index in FindSignature(data, ARP_ETHERNET_START):
+        AddARPFrame(oFrames, baseAddress, data, index, duplicates, filename)
+        found = True
+        if not multiple:
             return found
     return found
+
+
+# signatures carved by ExtractFrames, in the order their hits are added: name, regular expression for the start
+# of the signature, filter of the hits with an OUI filter, bulk check of the hits (or None), fields of a hit for a
+# cFrameFilter, function adding a hit
+def CarveSignatures(options):
+    return (
+        (
+            "ipv4",
+            IPV4_OPTIONS_HEADER_START if options else IPV4_HEADER_START,
+            FilterIPHeadersOUI,
+            CheckIPHeaders,
+            IPHeaderFields,
+            AddIPHeader,
+        ),
+        (
+            "arp",
+            ARP_ETHERNET_START,
+            FilterARPFramesOUI,
+            None,
+            ARPFrameFields,
+            AddARPFrame,
+        ),
+    )
+
+
+# every hit of every signature in the data; one scan per signature pattern, each a single C-level pass;
+# with dStats, the hits found by the pattern, examined after the OUI filter, valid after the check and matched by
+# oFilter are counted per signature
+def FindSignatures(data, signatures, ouiPrefixes=frozenset(), dStats=None, oFilter=None):
+    dHits = {}
+    for name, pattern, filterOUI, check, fields, _ in signatures:
+        indices = FindSignature(data, pattern)
+        countCandidates = len(indices)
+        if ouiPrefixes:
+            indices = filterOUI(data, indices, ouiPrefixes)
+        countExamined = len(indices)
+        if check is not None:
+            indices = check(data, indices)
+        countValid = len(indices)
+        if oFilter is not None:
+            indices = oFilter.Filter(data, indices, fields)
+        dHits[name] = indices
+        if dStats is not None:
+            if name not in dStats:
+                dStats[name] = {"candidates": 0, "examined": 0, "valid": 0, "matched": 0}
+            dStats[name]["candidates"] += countCandidates
+            dStats[name]["examined"] += countExamined
+            dStats[name]["valid"] += countValid
+            dStats[name]["matched"] += len(indices)
+    return dHits
+
+
+# carve IPv4 packets and ARP frames in one pass over the hits of all signatures
+def ExtractFrames(
+    oFrames,
+    baseAddress,
+    data,
+    options,
+    duplicates,
+    multiple,
+    filename="",
+    dStats=None,
+):
+    signatures = CarveSignatures(options)
+    dHits = FindSignatures(
+        data, signatures, oFrames.ouiPrefixes, dStats, oFrames.oFilter
+    )
+    found = False
+    for name, _, _, _, _, add in signatures:
+        for index in dHits[name]:
+            try:
+                add(oFrames, baseAddress, data, index, duplicates, filename)
+                found = True
+            except:
+                pass
+            if found and not multiple:
+                return found
+    return found
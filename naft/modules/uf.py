@@ -8,8 +8,15 @@ __date__ = "2026/06/29"
 
 import time
 import os
+import re
+import mmap
 import zipfile
+import gzip
+import bz2
+import lzma
 import sys
+import queue
+import threading
 from concurrent.futures import ProcessPoolExecutor
 from dateutil import parser as duparser
 from zoneinfo import ZoneInfo
@@ -74,14 +81,45 @@ def IsZIPFile(filename):
     return filename.lower().endswith(".zip")
 
 
-def File2Data(filename):
-    try:
-        if IsZIPFile(filename):
-            with zipfile.ZipFile(filename, "r") as oZipfile:
+COMPRESSED_EXTENSIONS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+
+
+def IsCompressedFile(filename):
+    return (
+        IsZIPFile(filename)
+        or os.path.splitext(filename)[1].lower() in COMPRESSED_EXTENSIONS
+    )
+
+
+# the decompressed members of an archive or compressed file fIn as (name, file object) pairs,
+# every file in a ZIP file (password protected with MALWARE_PASSWORD or not), the single member of others
+def CompressedMembers(filename, fIn):
+    if IsZIPFile(filename):
+        with zipfile.ZipFile(fIn, "r") as oZipfile:
+            for oZipInfo in oZipfile.infolist():
+                if oZipInfo.is_dir():
+                    continue
                 with oZipfile.open(
-                    oZipfile.infolist()[0], "r", MALWARE_PASSWORD
+                    oZipInfo, "r", MALWARE_PASSWORD.encode()
                 ) as oZipContent:
-                    return oZipContent.read()
+                    yield f"{filename}:{oZipInfo.filename}", oZipContent
+    else:
+        Open = COMPRESSED_EXTENSIONS[os.path.splitext(filename)[1].lower()]
+        with Open(fIn, "rb") as oContent:
+            yield filename, oContent
+
+
+def File2Data(filename):
+    try:
+        if IsCompressedFile(filename):
+            with open(filename, "rb") as fIn:
+                for name, oContent in CompressedMembers(filename, fIn):
+                    return oContent.read()
+                return b""
         else:
             with open(filename, "rb") as f:
                 return f.read()
@@ -91,6 +129,23 @@ def File2Data(filename):
         return None
 
 
+def MapFile(filename):
+    with open(filename, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# like File2Data, but a zero-copy memoryview of the memory-mapped file; compressed files are still read
+def File2MappedData(filename):
+    if IsCompressedFile(filename):
+        return File2Data(filename)
+    try:
+        return memoryview(MapFile(filename))
+    except ValueError:  # an empty file can not be mapped
+        return b""
+    except:
+        return None
+
+
 def Data2File(data, filename, path):
     try:
         full_path = os.path.join(path, filename)
@@ -141,12 +196,20 @@ def DumpBytes(memory, baseAddress, WIDTH=16):
         )
 
 
+# like string.find, but also for buffers without a find method, e.g. memoryview windows on a memory-mapped file
+def FindString(string, search, start=0):
+    oMatch = re.compile(re.escape(search)).search(string, start)
+    if oMatch is None:
+        return -1
+    return oMatch.start()
+
+
 def FindAllStrings(string, search):
     indices = []
-    index = string.find(search)
+    index = FindString(string, search)
     while index >= 0:
         indices.append(index)
-        index = string.find(search, index + 1)
+        index = FindString(string, search, index + 1)
     return indices
 
 
@@ -183,6 +246,7 @@ class cBufferFile:
 
     def __init__(self, filename, buffersize, bufferoverlapsize):
         self.filename = filename
+        self.name = filename
         self.buffersize = buffersize
         self.bufferoverlapsize = bufferoverlapsize
         self.fIn = None
@@ -205,7 +269,7 @@ class cBufferFile:
                 self.index = 0
                 self.buffer = self.fIn.read(self.buffersize + self.bufferoverlapsize)
             else:
-                self.buffer = self.buffer[-self.bufferoverlapsize :]
+                self.buffer = self.buffer[len(self.buffer) - self.bufferoverlapsize :]
                 tempBuffer = self.fIn.read(self.buffersize)
                 if not tempBuffer:
                     self.fIn.close()
@@ -230,5 +294,277 @@ class cBufferFile:
             self.err = True
             return False
 
+    # continue after the buffer ending at offset end, the next Read returns the buffer after it
+    def Skip(self, end):
+        try:
+            self.fIn = open(self.filename, "rb")
+            self.fIn.seek(end - self.bufferoverlapsize)
+            self.buffer = self.fIn.read(self.bufferoverlapsize)
+        except:
+            self.err = True
+            return False
+        self.index = end - self.bufferoverlapsize - self.buffersize
+        self.bytesread = end
+        return True
+
+    def Close(self):
+        self.buffer = None
+        if self.fIn is not None:
+            self.fIn.close()
+
     def Progress(self):
         return int(float(self.bytesread) / float(self.filesize) * 100.0)
+
+
+# start and end of the buffers cBufferFile reads from a file of filesize bytes
+def BufferWindows(filesize, buffersize, bufferoverlapsize):
+    start = 0
+    end = min(filesize, buffersize + bufferoverlapsize)
+    while end > start:
+        yield start, end
+        if end >= filesize:
+            return
+        start = end - bufferoverlapsize
+        end = min(filesize, start + buffersize + bufferoverlapsize)
+
+
+# same buffers as cBufferFile, but as zero-copy memoryview windows on a memory-mapped file;
+# without buffersize the whole file is one window
+class cMappedFile:
+
+    def __init__(self, filename, buffersize=None, bufferoverlapsize=0):
+        self.filename = filename
+        self.name = filename
+        self.buffersize = buffersize
+        self.bufferoverlapsize = bufferoverlapsize
+        self.oMap = None
+        self.err = False
+        self.index = None
+        self.buffer = None
+        self.filesize = os.path.getsize(self.filename)
+        self.bytesread = 0
+
+    def Read(self):
+        if self.index is None:
+            start = 0
+            try:
+                self.oMap = MapFile(self.filename)
+            except ValueError:  # empty file
+                return False
+            except:
+                self.err = True
+                return False
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                self.oMap.madvise(mmap.MADV_SEQUENTIAL)
+        elif self.oMap is None or self.bytesread >= self.filesize:
+            self.Close()
+            return False
+        else:
+            start = self.bytesread - self.bufferoverlapsize
+        if self.buffersize is None:
+            end = self.filesize
+        else:
+            end = min(self.filesize, start + self.buffersize + self.bufferoverlapsize)
+        self.index = start
+        self.buffer = memoryview(self.oMap)[start:end]
+        self.bytesread = end
+        return True
+
+    # continue after the buffer ending at offset end, the next Read returns the buffer after it
+    def Skip(self, end):
+        try:
+            self.oMap = MapFile(self.filename)
+        except:
+            self.err = True
+            return False
+        self.index = 0
+        self.bytesread = end
+        return True
+
+    def Close(self):
+        self.buffer = None
+        if self.oMap is not None:
+            try:
+                self.oMap.close()
+            except BufferError:  # windows still referenced, the map is closed when they are released
+                pass
+            self.oMap = None
+
+    def Progress(self):
+        return int(float(self.bytesread) / float(self.filesize) * 100.0)
+
+
+# same buffers as cBufferFile, decompressed from each member of a compressed file in turn; buffers
+# do not span members, index is the offset in the member named name, bytesread counts the
+# decompressed bytes of all members; without buffersize each member is one buffer
+class cStreamFile:
+
+    def __init__(self, filename, buffersize=None, bufferoverlapsize=0):
+        self.filename = filename
+        self.name = filename
+        self.buffersize = buffersize
+        self.bufferoverlapsize = bufferoverlapsize
+        self.fIn = None
+        self.members = None
+        self.oMember = None
+        self.err = False
+        self.index = None
+        self.buffer = None
+        self.filesize = os.path.getsize(self.filename)
+        self.bytesread = 0
+
+    # the rest of the member without size
+    def ReadMember(self, size):
+        if size is None:
+            return self.oMember.read()
+        return self.oMember.read(size)
+
+    def Read(self):
+        try:
+            if self.fIn is None:
+                self.fIn = open(self.filename, "rb")
+                self.members = CompressedMembers(self.filename, self.fIn)
+            while True:
+                if self.oMember is None:
+                    self.name, self.oMember = next(self.members, (self.filename, None))
+                    if self.oMember is None:
+                        self.Close()
+                        return False
+                    self.index = None
+                if self.index is None:
+                    self.buffer = self.ReadMember(
+                        None
+                        if self.buffersize is None
+                        else self.buffersize + self.bufferoverlapsize
+                    )
+                    if self.buffer:
+                        self.index = 0
+                        self.bytesread += len(self.buffer)
+                        return True
+                elif self.buffersize is not None:
+                    tempBuffer = self.ReadMember(self.buffersize)
+                    if tempBuffer:
+                        self.buffer = (
+                            self.buffer[len(self.buffer) - self.bufferoverlapsize :]
+                            + tempBuffer
+                        )
+                        self.index += self.buffersize
+                        self.bytesread += len(tempBuffer)
+                        return True
+                self.oMember = None
+        except MemoryError:
+            self.Close()
+            self.err = MemoryError
+            return False
+        except:
+            self.Close()
+            self.err = True
+            return False
+
+    # continue after the buffer ending at bytesread end, compressed data can only be skipped by decompressing it
+    def Skip(self, end):
+        while self.bytesread < end:
+            if not self.Read():
+                return False
+        return True
+
+    def Close(self):
+        self.buffer = None
+        if self.members is not None:
+            self.members.close()
+            self.members = None
+        self.oMember = None
+        if self.fIn is not None:
+            self.fIn.close()
+            self.fIn = None
+
+    # of the compressed file
+    def Progress(self):
+        if self.fIn is None:
+            return 100
+        return int(float(self.fIn.tell()) / float(self.filesize) * 100.0)
+
+
+# reads the buffers of oBufferFile on a thread, at most depth buffers ahead of the buffer returned by Read,
+# so that reading (and decompressing) the next buffers overlaps with carving this one
+class cPrefetchFile:
+
+    def __init__(self, oBufferFile, depth):
+        self.oBufferFile = oBufferFile
+        self.filename = oBufferFile.filename
+        self.name = oBufferFile.name
+        self.queue = queue.Queue(depth)
+        self.thread = None
+        self.stop = threading.Event()
+        self.err = False
+        self.index = None
+        self.buffer = None
+        self.bytesread = oBufferFile.bytesread
+        self.progress = 0
+
+    def ReadAhead(self):
+        oBufferFile = self.oBufferFile
+        while not self.stop.is_set():
+            if oBufferFile.Read():
+                self.queue.put(
+                    (
+                        oBufferFile.name,
+                        oBufferFile.index,
+                        oBufferFile.buffer,
+                        oBufferFile.bytesread,
+                        oBufferFile.Progress(),
+                    )
+                )
+            else:
+                self.queue.put(None)
+                return
+
+    def Read(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.ReadAhead, daemon=True)
+            self.thread.start()
+        item = self.queue.get()
+        if item is None:
+            self.thread.join()
+            self.err = self.oBufferFile.err
+            self.buffer = None
+            return False
+        self.name, self.index, self.buffer, self.bytesread, self.progress = item
+        return True
+
+    # before the first Read
+    def Skip(self, end):
+        result = self.oBufferFile.Skip(end)
+        self.err = self.oBufferFile.err
+        self.bytesread = self.oBufferFile.bytesread
+        return result
+
+    # the thread blocked on a full queue stops once the queue is drained
+    def Close(self):
+        self.buffer = None
+        if self.thread is not None:
+            self.stop.set()
+            while self.thread.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.thread.join()
+            self.thread = None
+        self.oBufferFile.Close()
+
+    def Progress(self):
+        return self.progress
+
+
+# prefetching reads the file, the next buffers are not in memory when the file is mapped
+def BufferFile(filename, buffersize, bufferoverlapsize, prefetch=0):
+    if IsCompressedFile(filename):
+        oBufferFile = cStreamFile(filename, buffersize, bufferoverlapsize)
+    elif prefetch > 0:
+        oBufferFile = cBufferFile(filename, buffersize, bufferoverlapsize)
+    else:
+        return cMappedFile(filename, buffersize, bufferoverlapsize)
+    if prefetch > 0:
+        return cPrefetchFile(oBufferFile, prefetch)
+    return oBufferFile
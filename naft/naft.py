@@ -50,7 +50,10 @@ def main():
     core_group.add_argument('--processes', action='store_true', help='Print processes: [-f] [-d] [-S]')
     core_group.add_argument('--check', action='store_true', help='Compare text in dump to IOS bin, requires -b/--bin')
     core_group.add_argument('--integrity', action='store_true', help='Check integrity of core dump')
-    core_parser.add_argument('coredump', help='Core dump file')
+    core_group.add_argument('--whereis', help='Print region, heap block, owner process and AllocName of each hexadecimal address, separated by commas or read from @file', metavar='ADDR[,ADDR...]')
+    core_group.add_argument('--pointers', help='Print the addresses in the heap, data and bss regions pointing into the heap block of each hexadecimal address, separated by commas or read from @file', metavar='ADDR[,ADDR...]')
+    core_group.add_argument('--batch', help='Run the functions given with --functions on one parse of the core dump, writing the output of each function to PATH/COREDUMP-FUNCTION.txt: [--functions] [-r] [-f] [-S] [-b]', metavar='PATH')
+    core_parser.add_argument('coredump', help='Core dump file, may be compressed (.zip, .gz, .bz2 or .xz)')
     core_parser.add_argument('-R', '--raw', action='store_true', default=False, help='Search the whole core dump for CW_ strings')
     core_parser.add_argument('-d', '--dump', action='store_true', default=False, help='Dump data')
     core_parser.add_argument('-D', '--dumpraw', action='store_true', default=False, help='Dump raw data')
@@ -63,24 +66,36 @@ def main():
     core_parser.add_argument('-b', '--bin', help='IOS bin file', metavar='FILE')
     core_parser.add_argument('-v', '--verbose', action='store_true', default=False, help='Increase output verbosity')
     core_parser.add_argument('-S', '--stats', action='store_true', default=False, help='Print process structure statistics')
+    core_parser.add_argument('--functions', default='regions,cwstrings,heap,history,events,processes,integrity', help='Comma-separated functions for --batch: regions, cwstrings, heap, history, events, processes, integrity and check (default all but check)', metavar='FUNCTIONS')
+    core_parser.add_argument('--layoutdb', help='Database of process structure layouts learned with heuristics, by IOS version (default ~/.naft/learned_process_layouts.json)', metavar='FILE')
+    core_parser.add_argument('--noindex', action='store_true', default=False, help='Parse the core dump again, without reading or writing the index of the parsed core dump (in ~/.naft/index)')
 
     network_parser = subparsers.add_parser('network', help='Generic Frame and Packet Extraction')
     network = network_parser.add_argument_group('functions')
     network_group = network.add_mutually_exclusive_group(required=True)
-    network_group.add_argument('--frames', help='Extract frames and store them in a .pcap file, requires --coredump & --iomem', metavar='PCAP')
-    network_group.add_argument('--packets', help='Extract packets and store them in a .pcap file, requires --files', metavar='PCAP')
+    network_group.add_argument('--frames', help='Extract frames and store them in a .pcap file (or .pcapng with the source of each frame), requires --coredump & --iomem', metavar='PCAP')
+    network_group.add_argument('--packets', help='Extract packets and store them in a .pcap file (or .pcapng with the source of each frame), requires --files', metavar='PCAP')
     frames = network_parser.add_argument_group('Frames options')
     frames.add_argument('--coredump', help='Core dump file', metavar='FILE')
     frames.add_argument('--iomem', help='iomem dump file', metavar='FILE')
     frames.add_argument('-v', '--verbose', action='store_true', default=False, help='Increase output verbosity')
     packets = network_parser.add_argument_group('Packets options')
-    packets.add_argument('--files', nargs='+', help='List of files to extract packets from, use --files <file1> <file2>', metavar='FILE')
+    packets.add_argument('--files', nargs='+', help='List of files to extract packets from, use --files <file1> <file2>; .zip, .gz, .bz2 and .xz files are decompressed while carving', metavar='FILE')
     packets.add_argument('-d', '--duplicates', action='store_true', default=False, help='Include duplicates')
     packets.add_argument('-p', '--options', action='store_true', default=False, help='Search for IPv4 headers with options')
     packets.add_argument('-t', '--ouitxt', help='File containing OUI\'s to filter for MAC addresses', metavar='FILE')
+    packets.add_argument('-F', '--filter', help='Only carve frames matching EXPRESSION: ip, arp, ether proto N, vlan [ID], tcp, udp, icmp, proto N, [src|dst] host ADDRESS, [src|dst] net CIDR, [src|dst] port N, combined with and, or, not and parentheses', metavar='EXPRESSION')
+    packets.add_argument('--summary', action='store_true', default=False, help='Do not store frames, write a traffic summary (top talkers, IP protocols, ports, VLAN IDs, ARP bindings) as JSON to the PCAP filename with extension .json and print it')
     packets.add_argument('-b', '--buffer', action='store_true', default=False, help='Buffer the file in 100MB blocks with 1MB overlap')
     packets.add_argument('-B', '--buffersize', type=int, default=100, help='Explicitly set size of buffer in MB (default 100MB)')
     packets.add_argument('-O', '--bufferoverlapsize', type=int, default=1, help='Explicitly set size of buffer overlap in MB (default 1MB)')
+    packets.add_argument('-P', '--prefetch', type=int, default=0, help='Read up to N buffers ahead on a background thread while carving, with -b (default 0, the file is memory-mapped)', metavar='N')
+    packets.add_argument('-j', '--jobs', type=int, default=1, help='Carve buffers in N parallel processes, buffered as with -b (default 1)', metavar='N')
+    packets.add_argument('-e', '--exported', help='Skip frames exported to PCAP files in earlier runs, and add the exported frames to FILE', metavar='FILE')
+    packets.add_argument('-S', '--stats', help='Show a live carving status line and write carving statistics to JSON file', metavar='FILE')
+    packets.add_argument('--checkpoint', help='Save a checkpoint to FILE every minute, and when interrupted', metavar='FILE')
+    packets.add_argument('--resume', help='Resume an interrupted extraction from checkpoint FILE', metavar='FILE')
+    packets.add_argument('-M', '--memory', type=int, help='Limit memory used for carved frames to MB, spill sorted frames to temporary files beyond it', metavar='MB')
 
     image_parser = subparsers.add_parser('image', help='IOS Image Analysis')
     image = image_parser.add_argument_group('functions')
@@ -89,7 +104,7 @@ def main():
     image_group.add_argument('-x', '--extract', help='Extract the compressed image to path, requires -b/--bin: [-m] [-v]', metavar='PATH')
     image_group.add_argument('-I', '--ida', help='Extract the compressed image to path and patch it for IDA Pro, requires -b/--bin: [-m] [-v]', metavar='PATH')
     image_group.add_argument('-s', '--scan', help='Scan specific image or all images within DIR: [-R] [-r] [-m] [-l]', metavar='FILE/DIR')
-    image_parser.add_argument('-b', '--bin', help='IOS bin file', metavar='FILE')
+    image_parser.add_argument('-b', '--bin', help='IOS bin file, may be compressed (.zip, .gz, .bz2 or .xz)', metavar='FILE')
     image_parser.add_argument('-m', '--md5db', help='Compare MD5 hash with provided CSV formatted db', metavar='CSV')
     image_parser.add_argument('-R', '--recurse', action='store_true', default=False, help='Recursively search sub-directories for images')
     image_parser.add_argument('-r', '--resume', help='Resume an interrupted scan from Pickle file', metavar='PKL')
@@ -102,28 +117,40 @@ def main():
         main_parser.print_help()
         main_parser.exit()
     if sys.argv[1] == 'core':
-        if args.regions:
-            icd.IOSRegions(args.coredump, all_args)
-        elif args.cwstrings:
-            icd.IOSCWStrings(args.coredump, all_args)
-        elif args.heap:
-            if args.grep and not args.strings:
-                missing_req('strings')
+        if args.heap and args.grep and not args.strings:
+            missing_req('strings')
+        elif args.check and not args.bin:
+            missing_req('bin')
+        elif not args.batch or icd.IOSBatchArguments(args.batch, all_args):
+            # the core dump is parsed once, and the index of the parsed core dump is written once at the end
+            if args.cwstrings and args.raw:
+                oIOSCoreDump = None
             else:
-                icd.IOSHeap(args.coredump, all_args)
-        elif args.history:
-            icd.IOSHistory(args.coredump)
-        elif args.events:
-            icd.IOSEvents(args.coredump)
-        elif args.processes:
-            icd.IOSProcesses(args.coredump, all_args)
-        elif args.check:
-            if not args.bin:
-                missing_req('bin')
-            else:
-                icd.IOSCheckText(args.coredump, args.bin, all_args)
-        elif args.integrity:
-            icd.IOSIntegrityText(args.coredump, all_args)
+                oIOSCoreDump = icd.CoreDump(args.coredump, all_args)
+            if args.regions:
+                icd.IOSRegions(args.coredump, all_args, oIOSCoreDump)
+            elif args.cwstrings:
+                icd.IOSCWStrings(args.coredump, all_args, oIOSCoreDump)
+            elif args.heap:
+                icd.IOSHeap(args.coredump, all_args, oIOSCoreDump)
+            elif args.history:
+                icd.IOSHistory(args.coredump, all_args, oIOSCoreDump)
+            elif args.events:
+                icd.IOSEvents(args.coredump, all_args, oIOSCoreDump)
+            elif args.processes:
+                icd.IOSProcesses(args.coredump, all_args, oIOSCoreDump)
+            elif args.check:
+                icd.IOSCheckText(args.coredump, args.bin, all_args, oIOSCoreDump)
+            elif args.integrity:
+                icd.IOSIntegrityText(args.coredump, all_args, oIOSCoreDump)
+            elif args.whereis:
+                icd.IOSWhereIs(args.coredump, all_args, oIOSCoreDump)
+            elif args.pointers:
+                icd.IOSPointers(args.coredump, all_args, oIOSCoreDump)
+            elif args.batch:
+                icd.IOSBatch(args.coredump, args.batch, all_args, oIOSCoreDump)
+            if oIOSCoreDump is not None:
+                oIOSCoreDump.Save()
     if sys.argv[1] == 'network':
         if args.frames:
             if not args.coredump or not args.iomem:
@@ -131,7 +158,7 @@ def main():
             else:
                 gfe.IOSFrames(args.coredump, args.iomem, args.frames, all_args)
         elif args.packets:
-            if not args.files:
+            if not args.files and not args.resume:
                 missing_req('files')
             else:
                 gfe.ExtractIPPacketsFromFile(args.files, args.packets, all_args)